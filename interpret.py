@@ -6,10 +6,19 @@
 #
 
 import xml.etree.ElementTree as ET
-import sys, re
+import sys, re, gc
+from functools import partial
+from operator import lt, gt, eq
+from time import perf_counter
 
 from src_interpret.error import ErrorMessages
 from src_interpret.components import *
+from src_interpret.streams import InputReader, OutputBuffer
+from src_interpret.cache import ProgramCache
+from src_interpret.optimizer import Optimizer
+from src_interpret.compiler import BlockCompiler
+from src_interpret.profiler import Profiler, Sampler
+from src_interpret.source import SourceParser
 
 class Interpret:
     """Process input source code and generate output."""
@@ -48,325 +57,743 @@ class Interpret:
                     "STRI2INT" : 3,
                     "CONCAT" : 3,
                     "GETCHAR" : 3,
-                    "SETCHAR" : 3
+                    "SETCHAR" : 3,
+                    "CLEARS" : 0,
+                    "ADDS" : 0,
+                    "SUBS" : 0,
+                    "MULS" : 0,
+                    "IDIVS" : 0,
+                    "LTS" : 0,
+                    "GTS" : 0,
+                    "EQS" : 0,
+                    "ANDS" : 0,
+                    "ORS" : 0,
+                    "NOTS" : 0,
+                    "INT2CHARS" : 0,
+                    "STRI2INTS" : 0,
+                    "JUMPIFEQS" : 1,
+                    "JUMPIFNEQS" : 1
                 }
 
+    # opcodes with label operand resolved to position of the label
+    JUMPS = ["JUMP", "CALL", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS"]
+
+    # escape sequence in string literal
+    ESCAPE_SEQ = re.compile(r"\\(\d{3})")
+
+    # program options -> option requires value
+    OPTIONS = {"source" : True,
+               "input" : True,
+               "output-buffer" : True,
+               "cache" : False,
+               "cache-dir" : True,
+               "no-cache" : False,
+               "optimize" : False,
+               "compile" : False,
+               "profile" : False,
+               "profile-file" : True,
+               "sample" : True,
+               "source-format" : True
+            }
+
+    # opcode -> (handler method, extra arguments of the handler)
+    DISPATCH = {"MOVE" : ("MOVE",),
+                "CREATEFRAME" : ("CREATEFRAME",),
+                "PUSHFRAME" : ("PUSHFRAME",),
+                "POPFRAME" : ("POPFRAME",),
+                "RETURN" : ("RETURN_PRG",),
+                "BREAK" : ("BREAK_PRG",),
+                "LABEL" : ("LABEL",),
+                "JUMP" : ("JUMP",),
+                "CALL" : ("CALL",),
+                "EXIT" : ("EXIT_PRG",),
+                "DPRINT" : ("DPRINT",),
+                "WRITE" : ("WRITE",),
+                "PUSHS" : ("PUSHS",),
+                "DEFVAR" : ("DEFVAR",),
+                "POPS" : ("POPS",),
+                "TYPE" : ("TYPE",),
+                "STRLEN" : ("STRLEN",),
+                "INT2CHAR" : ("INT2CHAR",),
+                "READ" : ("READ",),
+                "JUMPIFEQ" : ("JUMPIF", True),
+                "JUMPIFNEQ" : ("JUMPIF", False),
+                "AND" : ("LOGICAL_OP", "and"),
+                "OR" : ("LOGICAL_OP", "or"),
+                "NOT" : ("LOGICAL_OP", "not"),
+                "LT" : ("COMPARE", "<"),
+                "GT" : ("COMPARE", ">"),
+                "EQ" : ("COMPARE", "="),
+                "IDIV" : ("MATH_OPERATIONS", "/"),
+                "MUL" : ("MATH_OPERATIONS", "*"),
+                "SUB" : ("MATH_OPERATIONS", "-"),
+                "ADD" : ("MATH_OPERATIONS", "+"),
+                "STRI2INT" : ("STRI2CHAR",),
+                "CONCAT" : ("CONCAT",),
+                "GETCHAR" : ("GETCHAR",),
+                "SETCHAR" : ("SETCHAR",),
+                "CLEARS" : ("CLEARS",),
+                "ADDS" : ("STACK_MATH_OPERATIONS", "+"),
+                "SUBS" : ("STACK_MATH_OPERATIONS", "-"),
+                "MULS" : ("STACK_MATH_OPERATIONS", "*"),
+                "IDIVS" : ("STACK_MATH_OPERATIONS", "/"),
+                "LTS" : ("STACK_COMPARE", "<"),
+                "GTS" : ("STACK_COMPARE", ">"),
+                "EQS" : ("STACK_COMPARE", "="),
+                "ANDS" : ("STACK_LOGICAL_OP", "and"),
+                "ORS" : ("STACK_LOGICAL_OP", "or"),
+                "NOTS" : ("STACK_LOGICAL_OP", "not"),
+                "INT2CHARS" : ("INT2CHARS",),
+                "STRI2INTS" : ("STRI2INTS",),
+                "JUMPIFEQS" : ("STACK_JUMPIF", True),
+                "JUMPIFNEQS" : ("STACK_JUMPIF", False),
+                # superinstructions created by optimizer
+                "DEFVAR_MOVE" : ("DEFVAR_MOVE",),
+                "PUSHS_POPS" : ("PUSHS_POPS",),
+                "LT_JUMP" : ("COMPARE_JUMP", "<"),
+                "GT_JUMP" : ("COMPARE_JUMP", ">"),
+                "EQ_JUMP" : ("COMPARE_JUMP", "=")
+            }
+
+    # opcode -> handler without type checks for instructions with proven types
+    TYPED_DISPATCH = {"ADD" : ("TYPED_MATH_OPERATIONS", "+"),
+                      "SUB" : ("TYPED_MATH_OPERATIONS", "-"),
+                      "MUL" : ("TYPED_MATH_OPERATIONS", "*"),
+                      "IDIV" : ("TYPED_MATH_OPERATIONS", "/"),
+                      "LT" : ("TYPED_COMPARE", lt),
+                      "GT" : ("TYPED_COMPARE", gt),
+                      "EQ" : ("TYPED_COMPARE", eq),
+                      "AND" : ("TYPED_LOGICAL_OP", "and"),
+                      "OR" : ("TYPED_LOGICAL_OP", "or"),
+                      "NOT" : ("TYPED_LOGICAL_OP", "not"),
+                      "CONCAT" : ("TYPED_CONCAT",),
+                      "STRLEN" : ("TYPED_STRLEN",),
+                      "GETCHAR" : ("TYPED_GETCHAR",),
+                      "STRI2INT" : ("TYPED_STRI2CHAR",),
+                      "JUMPIFEQ" : ("TYPED_JUMPIF", True),
+                      "JUMPIFNEQ" : ("TYPED_JUMPIF", False),
+                      "LT_JUMP" : ("TYPED_COMPARE_JUMP", lt),
+                      "GT_JUMP" : ("TYPED_COMPARE_JUMP", gt),
+                      "EQ_JUMP" : ("TYPED_COMPARE_JUMP", eq)
+            }
+
     def __init__(self):
         # source code XML
         self.source = "STDIN"
+        # format of source code, "xml" or "text" (IPPcode22)
+        self.sourceFormat = "xml"
         # code for XML (read, ...)
         self.input = "STDIN"
         # labels list
         self.labels = {}
-        # source code
-        self.code = ""
+        # root element of source code
+        self.code = None
+        # events of XML parser during loading
+        self.xmlEvents = None
+        # cache of loaded programs
+        self.cache = None
+        # optimize program before interpretation
+        self.optimize = False
+        # compile basic blocks to Python functions
+        self.compileBlocks = False
+        # compiled blocks indexed by position of their first instruction
+        self.blocks = None
+        # profiler of executed instructions
+        self.profiler = None
+        # sampling profiler of call stack
+        self.sampler = None
+        # decoded string literals
+        self.stringConstants = {}
         # parsed code to instructions
         self.instructionsArray = []
-        # jump and call stack
+        # stack of return positions
         self.callStack = []
+        # stack of values for stack opcodes
+        self.dataStack = []
         # instruction counter
         self.instructionCounter = 0
         # frames class
         self.frames = Frames()
-        # read usage
-        self.readUsage = 0
+        # reader of inputs for READ
+        self.inputReader = None
+        # output buffers for WRITE and DPRINT
+        self.outputThreshold = OutputBuffer.THRESHOLD
+        self.stdout = None
+        self.stderr = None
 
 
     def load_args(self):
         """Load and validate program arguments."""
-        argv = sys.argv
-        argc = len(argv)
-
-        if argc == 1:
-            ErrorMessages.exit_code(10)  
-        elif argc == 2:
-            if argv[1] == "--help":
-                print("\nScript loads XML representation of source code")
-                print("interprets it and generates output.")
-                print("\nUsage:")
-                print("         python3 interpret.py")
-                print("         python3 interpret.py --help")
-                print("         python3 interpret.py [--source=file] [--input=file]")
-                print("Options:")
-                print("         --help          print help and exit program")
-                print("         --source=file   input source code XML")
-                print("         --input=file    file with inputs for interpret")
-                sys.exit(0)
-            elif re.search(r"^--source=.+$", argv[1]):
-                self.source = re.findall(r"(?<=\=).*", argv[1])[0]
-            elif re.search(r"^--input=.+$", argv[1]):
-                self.input = re.findall(r"(?<=\=).*", argv[1])[0]
-            else:
-                ErrorMessages.exit_code(10)   
-        elif argc == 3:
-            r = re.compile(r"^(--source=|--input=).+$")
-            files = list(filter(r.match, argv))
-            
-            # too many arguments
-            if len(files) != 2:
+        argv = sys.argv[1:]
+
+        if not argv:
+            ErrorMessages.exit_code(10)
+
+        if "--help" in argv:
+            if len(argv) != 1:
+                ErrorMessages.exit_code(10)
+            print("\nScript loads XML representation of source code")
+            print("interprets it and generates output.")
+            print("\nUsage:")
+            print("         python3 interpret.py")
+            print("         python3 interpret.py --help")
+            print("         python3 interpret.py [--source=file] [--input=file] [options]")
+            print("Options:")
+            print("         --help              print help and exit program")
+            print("         --source=file       input source code XML")
+            print("         --source-format=fmt source code format, xml (default) or text (IPPcode22)")
+            print("         --input=file        file with inputs for interpret")
+            print("         --output-buffer=n   flush output after n characters, 0 disables buffering")
+            print("         --cache             cache loaded program from source file")
+            print("         --cache-dir=dir     cache loaded program in directory dir")
+            print("         --no-cache          do not use cache of loaded programs (default)")
+            print("         --optimize          optimize program before interpretation")
+            print("         --compile           compile basic blocks to Python code before interpretation")
+            print("         --profile           write profile of executed instructions to stderr on exit")
+            print("         --profile-file=file write profile to file instead of stderr")
+            print("         --sample=file       write sampled call stacks to file in collapsed format")
+            sys.exit(0)
+
+        options = {}
+        for arg in argv:
+            match = re.search(r"^--([a-z-]+)(=(.+))?$", arg)
+            if not match or match.group(1) in options or match.group(1) not in self.OPTIONS:
                 ErrorMessages.exit_code(10)
             
-            for item in files:
-                item = re.split(r"=", item)
-                if len(item) != 2:
-                    ErrorMessages.exit_code(10)
-                
-                if item[0] == "--source" and self.source == "STDIN":
-                    self.source = item[1]
-                elif item[0] == "--input" and self.input == "STDIN":
-                    self.input = item[1]
-                else:
-                    ErrorMessages.exit_code(10)
-        else:
+            name, value = match.group(1), match.group(3)
+            # option needs value or it is a flag
+            if self.OPTIONS[name] != (value is not None):
+                ErrorMessages.exit_code(10)
+            options[name] = value
+
+        # at least one of source and input is required
+        if "source" not in options and "input" not in options:
             ErrorMessages.exit_code(10)
         
+        self.source = options.get("source", "STDIN")
+        self.input = options.get("input", "STDIN")
+
+        self.sourceFormat = options.get("source-format", "xml")
+        if self.sourceFormat not in ["xml", "text"]:
+            ErrorMessages.exit_code(10)
+
         # input and source file cannot be the same
         if self.input == self.source:
             ErrorMessages.exit_code(10)
 
+        if "output-buffer" in options:
+            if not options["output-buffer"].isdigit():
+                ErrorMessages.exit_code(10)
+            self.outputThreshold = int(options["output-buffer"])
+
+        if "no-cache" in options:
+            if "cache" in options or "cache-dir" in options:
+                ErrorMessages.exit_code(10)
+        elif "cache" in options or "cache-dir" in options:
+            self.cache = ProgramCache(options.get("cache-dir"))
+
+        self.optimize = "optimize" in options
+        self.compileBlocks = "compile" in options
+
+        if "profile" in options:
+            self.profiler = Profiler(options.get("profile-file"))
+            self.profiler.open()
+        elif "profile-file" in options:
+            ErrorMessages.exit_code(10)
+
+        if "sample" in options:
+            self.sampler = Sampler(options["sample"])
+        self.inputReader = InputReader(self.input)
+
 
     def load_source_code(self):
-        """Load XML source code and send it to further validation."""
-        tree = None
+        """Load source code and send it to further validation."""
+        source = sys.stdin if self.source == "STDIN" else self.source
+        key = None
+
+        if self.cache is not None and source is not sys.stdin:
+            key = self.cache.hash_source(source, self.sourceFormat)
+            cached = self.cache.load(key)
+            if cached is not None:
+                self.instructionsArray, self.labels = cached
+                return
+
+        if self.sourceFormat == "text":
+            self.load_text_source(sys.stdin.buffer if source is sys.stdin else source)
+        else:
+            self.load_XML_source(source)
+        self.check_code()
+
+        if key is not None:
+            self.cache.save(key, self.instructionsArray, self.labels)
+
+
+    def load_text_source(self, source):
+        """Parse IPPcode22 source code directly without XML.
+
+        Whole source code is checked first, so lexical and syntactic
+        errors are reported before errors of loaded instructions
+        as by parse.php and loading of its XML.
+        """
+        parsed = list(SourceParser(source).instructions())
+        for order, (opcode, operands) in enumerate(parsed, 1):
+            instruction = Instruction()
+            instruction.order = order
+            instruction.opcode = opcode
+            for type, text in operands:
+                self.add_argument(instruction, type, text)
+            self.instructionsArray.append(instruction)
+
+
+    def load_XML_source(self, source):
+        """Load XML source code incrementally.
+        
+        Instructions are built as soon as their elements are parsed
+        and the elements are released immediately afterwards.
+        """
+        # instructions arrive in ascending order from parse.php
+        ascending = True
 
-        # parse XML source
         try:
-            if self.source == "STDIN":
-                tree = ET.parse(sys.stdin)
-            else:
-                tree = ET.parse(self.source)
-        except:
+            self.xmlEvents = ET.iterparse(source, events=("start", "end"))
+
+            depth = 0
+            for event, element in self.xmlEvents:
+                if event == "start":
+                    depth += 1
+                    if depth == 1:
+                        self.code = element
+                        self.check_XML_root()
+                    elif depth == 2 and element.tag != "instruction":
+                        self.structure_error()
+                    continue
+
+                depth -= 1
+                if depth == 1:
+                    instruction = self.parse_instruction(element)
+                    if self.instructionsArray and instruction.order <= self.instructionsArray[-1].order:
+                        ascending = False
+                    self.instructionsArray.append(instruction)
+                    
+                    # release parsed element
+                    self.code.remove(element)
+        except (ET.ParseError, OSError):
             ErrorMessages.exit_code(31)
 
-        self.code = tree.getroot()
+        self.xmlEvents = None
+        if self.code is None:
+            ErrorMessages.exit_code(31)
+
+        if not ascending:
+            self.sort_instructions_by_order()
+
+
+    def structure_error(self):
+        """Exit with error 32 in the XML structure.
         
-        self.check_XML_root()
-        self.sort_instructions_by_order()
-        self.check_code()
+        Error in XML format (31) has priority, so the rest
+        of the XML source is checked first.
+        """
+        try:
+            if self.xmlEvents is not None:
+                for _ in self.xmlEvents:
+                    pass
+        except (ET.ParseError, OSError):
+            ErrorMessages.exit_code(31)
+        ErrorMessages.exit_code(32)
       
 
     def check_XML_root(self):
         """Validate XML root element and his attributes."""
         if self.code.tag != "program" or self.code.get("language") != "IPPcode22":
-            ErrorMessages.exit_code(32)
+            self.structure_error()
     
         for k, v in self.code.attrib.items():
             if k not in ["language", "name", "description"]:
-                ErrorMessages.exit_code(32)
+                self.structure_error()
 
 
     def sort_instructions_by_order(self):
         """Sort instructions in ascending order by attribute 'order'."""
-        try:
-            self.code[:] = sorted(self.code, key=lambda child: (int(child.get("order"))))
-        except:
-            ErrorMessages.exit_code(32)
+        self.instructionsArray.sort(key=lambda instruction: instruction.order)
 
     
     def escape_seq_to_string(self, escape_seq):
-        """Convert escape sequences and XML special characters."""
-        if escape_seq == "":
-            return ""
-
-        re.sub("&gt;", ">", escape_seq)
-        re.sub("&lt;", "<", escape_seq)
-        re.sub("&amp;", "&", escape_seq)
-        re.sub("&quot;", "\"", escape_seq)
-        re.sub("&apos;", "\'", escape_seq)
-
-        res = ""
-        i = 0
-        while i < len(escape_seq):
-            if escape_seq[i] == '\\':
-                res += chr(int(escape_seq[i+1:i+4]))
-                i += 3
-            else:
-                res += escape_seq[i]
-            i += 1
-        return res 
+        """Convert escape sequences to characters.
+        
+        XML special characters are already converted by XML parser.
+        """
+        if "\\" not in escape_seq:
+            return escape_seq
+
+        return self.ESCAPE_SEQ.sub(lambda match: chr(int(match.group(1))), escape_seq)
+
 
+    def decode_constant(self, type, text):
+        """Convert literal to constant with value of native type."""
+        if text == None:
+            text = ""
 
-    def parse_instruction(self, tag, position):    
-        """Split instrucions to opcode and arguments and save labels."""
+        if type == "int":
+            try:
+                return Const(INT, int(text))
+            except:
+                self.structure_error()
+        elif type == "bool" and text in ["true", "false"]:
+            return TRUE if text == "true" else FALSE
+        elif type == "nil" and text == "nil":
+            return NIL_CONST
+        elif type == "string":
+            # same literals repeat across the program
+            if text not in self.stringConstants:
+                self.stringConstants[text] = Const(STRING, self.escape_seq_to_string(text))
+            return self.stringConstants[text]
+
+        self.structure_error()
+
+
+    def parse_instruction(self, tag) -> Instruction:    
+        """Split instrucion to opcode and arguments."""
         instruction = Instruction()
         
         try: 
-            instruction.order = tag.attrib.get("order")
+            instruction.order = int(tag.attrib.get("order"))
             instruction.opcode = tag.attrib.get("opcode").upper()
         except:
-            ErrorMessages.exit_code(32)
+            self.structure_error()
 
         if instruction.opcode in self.INSTRUCTIONS:
             no_args = self.INSTRUCTIONS[instruction.opcode]
         else:
-            ErrorMessages.exit_code(32)
+            self.structure_error()
 
         if len([child for child in tag.iter()]) -1 > no_args:
-            ErrorMessages.exit_code(32)
+            self.structure_error()
 
         for i in range(no_args):
             try:
                 arg = tag.find(f"arg{i+1}")
                 type = arg.attrib.get("type")
             except:
-                ErrorMessages.exit_code(32)
-            
-            if type == "var":
-                frame, name = arg.text.split('@')
-                instruction.args.append([name, frame])
-            else:
-                text = arg.text              
-                if type == "string":
-                    if text == None:
-                        text = ""
-                    text = self.escape_seq_to_string(text)
-                
-                instruction.args.append(text)
-            
-            instruction.types.append(type)
-            instruction.no_args += 1
+                self.structure_error()
+            self.add_argument(instruction, type, arg.text)
+
+        return instruction
+
+
+    def add_argument(self, instruction, type, text):
+        """Append argument with given type and text to instruction."""
+        if type == "var":
+            try:
+                frame, name = text.split('@')
+            except:
+                self.structure_error()
+            instruction.args.append([name, frame])
+        elif type in ["label", "type"]:
+            instruction.args.append(text)
+        else:
+            instruction.args.append(self.decode_constant(type, text))
+        
+        instruction.types.append(type)
+        instruction.no_args += 1
 
-        self.instructionsArray.append(instruction)
 
-        # create list of labels
-        if instruction.opcode == "LABEL":
-                label_name = tag.find("arg1").text
+    def check_code(self):
+        """Validate attribute 'order' and create list of labels."""
+        previousOrder = 0
+        for position, instruction in enumerate(self.instructionsArray):
+            if instruction.order <= 0 or instruction.order == previousOrder:
+               ErrorMessages.exit_code(32)
+            previousOrder = instruction.order
+
+            if instruction.opcode == "LABEL":
+                if instruction.types[0] != "label":
+                    ErrorMessages.exit_code(32)
+                label_name = instruction.args[0]
                 if label_name in self.labels:
                     ErrorMessages.exit_code(52)
                 else:
                     self.labels[label_name] = position
 
 
-    def check_code(self):
-        """Validate attribute 'order' and send instruction for parsing."""
-        # position of instruction in instruction list
-        position = 0
+    def resolve_labels(self):
+        """Resolve label operands of jumps to positions of their labels.
+        
+        Jump sets instruction counter to position of the label,
+        so the main loop continues with the instruction after it.
+        """
+        for instruction in self.instructionsArray:
+            if instruction.opcode in self.JUMPS:
+                if instruction.types[0] != "label":
+                    ErrorMessages.exit_code(32)
+                if instruction.args[0] not in self.labels:
+                    ErrorMessages.exit_code(52)
+                instruction.target = self.labels[instruction.args[0]]
 
-        previousOrder = -1  
-        for child in self.code:
-            if child.tag != "instruction":
-                ErrorMessages.exit_code(32)
 
-            order = int(child.attrib.get("order"))
-            if order <= 0 or order == previousOrder:
-               ErrorMessages.exit_code(32)
-            previousOrder = order
+    def resolve_variables(self):
+        """Replace variable operands by references to frame slots.
+        
+        GF operands are bound directly to their variables. LF and TF
+        operands get a slot offset computed by local_layout(), frames
+        check the name in the slot, so the offset is only the expected
+        position of the variable. CREATEFRAME gets size of TF defined
+        by DEFVARs following it.
+        """
+        operands = []
+        for position, instruction in enumerate(self.instructionsArray):
+            for i in range(instruction.no_args):
+                if instruction.types[i] == "var":
+                    operands.append((position, instruction, i))
+
+        layout = self.local_layout(operands)
+        for _, instruction, i in operands:
+            name, frame = instruction.args[i]
+            if frame == "GF":
+                instruction.args[i] = VarRef(name, GF, var=self.frames.global_var(name))
+            elif frame not in ("LF", "TF"):
+                ErrorMessages.exit_code(32)
+            else:
+                # names used only in unreachable code are not in the layout
+                instruction.args[i] = VarRef(name, LF if frame == "LF" else TF, layout.get(name, 0))
 
-            self.parse_instruction(child, position)
+        code = self.instructionsArray
+        for position, instruction in enumerate(code):
+            if instruction.opcode != "CREATEFRAME":
+                continue
             position += 1
+            while position < len(code) and code[position].opcode == "DEFVAR" and code[position].args[0].frame == TF:
+                instruction.size = max(instruction.size, code[position].args[0].slot + 1)
+                position += 1
+
+
+    def local_layout(self, operands):
+        """Assign slot offsets to names of LF and TF variables.
+
+        Function is the code reachable from the start of the program
+        or from a CALL target without following CALLs. Names used in one
+        function, or in a function and in a function called from it,
+        may be in the same frame and get different offsets. Names of
+        unrelated functions share offsets, so frames stay small even
+        in programs with many functions.
+
+            :param operands: list of (position, instruction, index of operand)
+            :return: dictionary name -> slot offset
+        """
+        code = self.instructionsArray
+        entries = sorted({0} | {instruction.target for instruction in code if instruction.opcode == "CALL"})
+        # position -> functions containing the instruction
+        functions = [[] for _ in code]
+        for function, entry in enumerate(entries):
+            stack = [entry]
+            while stack:
+                position = stack.pop()
+                if position >= len(code) or (functions[position] and functions[position][-1] == function):
+                    continue
+                functions[position].append(function)
+                instruction = code[position]
+                if instruction.opcode in self.JUMPS and instruction.opcode != "CALL":
+                    stack.append(instruction.target)
+                if instruction.opcode not in ("JUMP", "RETURN", "EXIT"):
+                    stack.append(position + 1)
+
+        # function -> names of local variables used in it, DEFVAR first
+        names = [[] for _ in entries]
+        seen = [set() for _ in entries]
+        for defvar in [True, False]:
+            for position, instruction, i in operands:
+                name, frame = instruction.args[i]
+                if frame not in ("LF", "TF") or (instruction.opcode == "DEFVAR") != defvar:
+                    continue
+                for function in functions[position]:
+                    if name not in seen[function]:
+                        seen[function].add(name)
+                        names[function].append(name)
+
+        # function -> functions sharing frames with it through CALL
+        linked = [{function} for function in range(len(entries))]
+        callees = {entry : function for function, entry in enumerate(entries)}
+        for position, instruction in enumerate(code):
+            if instruction.opcode == "CALL":
+                callee = callees[instruction.target]
+                for caller in functions[position]:
+                    linked[caller].add(callee)
+                    linked[callee].add(caller)
+
+        # name -> functions using it, function -> offsets of its names
+        usedIn = {}
+        for function, functionNames in enumerate(names):
+            for name in functionNames:
+                usedIn.setdefault(name, []).append(function)
+        slots = [set() for _ in entries]
+
+        layout = {}
+        for functionNames in names:
+            for name in functionNames:
+                if name in layout:
+                    continue
+                used = set()
+                for function in usedIn[name]:
+                    for related in linked[function]:
+                        used |= slots[related]
+                slot = 0
+                while slot in used:
+                    slot += 1
+                layout[name] = slot
+                for function in usedIn[name]:
+                    slots[function].add(slot)
+        return layout
+
+
+    def optimize_code(self):
+        """Run optimization passes over resolved instructions."""
+        self.instructionsArray = Optimizer(self.instructionsArray, self).optimize()
+
+
+    def compile_instructions(self):
+        """Bind every instruction to its handler before execution.
         
+        The main loop then executes an instruction with a single call
+        instead of comparing its opcode with all known opcodes.
+        Instructions with proven operand types skip type checks.
+        """
+        for instruction in self.instructionsArray:
+            if instruction.typed:
+                method, *extra = self.TYPED_DISPATCH[instruction.opcode]
+            else:
+                method, *extra = self.DISPATCH[instruction.opcode]
+            instruction.handler = partial(getattr(self, method), instruction, *extra)
+        
+    
+    def compile_blocks(self):
+        """Compile basic blocks of bound instructions to Python functions.
+        
+        If the compilation fails, instructions are interpreted one by one.
+        """
+        self.blocks = BlockCompiler(self).compile()
+
     
     ########################################
     ######### METHODS for OPCODES ##########
     ########################################
     
-    def check_var(self, varName, varFrame, checkValue=False):
+    def check_var(self, ref : VarRef, checkValue=False):
         """Check var existence in the given frame."""
-        var = self.frames.find_var(varName, varFrame)
+        var = self.frames.find_var(ref)
         if not var:
             ErrorMessages.exit_code(54)
-        if checkValue and var.value == None:
-            ErrorMessages.exit_code(56)
+        if checkValue:
+            if var.value is None:
+                ErrorMessages.exit_code(56)
+            if var.value.__class__ is StringBuffer:
+                var.value = str(var.value)
         return var
 
-    
-    def MOVE(self, instruction : Instruction):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
 
-        if instruction.types[1] == "var":     
-            src = self.check_var(instruction.args[1][0], instruction.args[1][1], True)         
-            dest.change_value(src.value, src.type)
+    def symb(self, operand):
+        """Get constant or initialized variable of operand <symb>.
+        
+        Both have attributes 'type' and 'value'.
+        """
+        if operand.__class__ is Const:
+            return operand
+        return self.check_var(operand, True)
+
+
+    def symb_of_type(self, operand, type):
+        """Get operand <symb> and check its type."""
+        symb = self.symb(operand)
+        if symb.type != type:
+            ErrorMessages.exit_code(53)
+        return symb
+
+
+    def string_value(self, operand):
+        """Get value of string operand <symb> without converting StringBuffer to str."""
+        if operand.__class__ is Const:
+            symb = operand
         else:
-            dest.change_value(instruction.args[1], instruction.types[1])
+            symb = self.check_var(operand)
+            if symb.value is None:
+                ErrorMessages.exit_code(56)
+        if symb.type != STRING:
+            ErrorMessages.exit_code(53)
+        return symb.value
+
+    
+    def MOVE(self, instruction : Instruction):
+        dest = self.check_var(instruction.args[0])
+        src = self.symb(instruction.args[1])
+        dest.change_value(src.value, src.type)
 
     
-    def RETURN_PRG(self):
+    def CREATEFRAME(self, instruction : Instruction):
+        self.frames.create_frame(instruction.size)
+
+
+    def PUSHFRAME(self, instruction : Instruction):
+        self.frames.push_frame()
+
+
+    def POPFRAME(self, instruction : Instruction):
+        self.frames.pop_frame()
+
+
+    def DEFVAR(self, instruction : Instruction):
+        self.frames.add_var(instruction.args[0])
+
+
+    def CALL(self, instruction : Instruction):
+        self.callStack.append(self.instructionCounter+1)
+        self.instructionCounter = instruction.target
+
+
+    def RETURN_PRG(self, instruction : Instruction):
         if self.callStack:
-            self.instructionCounter = self.callStack.pop()
+            # main loop moves the counter to the returned position
+            self.instructionCounter = self.callStack.pop() - 1
         else:
             ErrorMessages.exit_code(56)
 
 
     def PUSHS(self, instruction):
         if instruction.types[0] == "var":
-            var = self.check_var(instruction.args[0][0], instruction.args[0][1], True)
-                
-            self.callStack.append(var.value)
+            var = self.check_var(instruction.args[0], True)
+            self.dataStack.append(Const(var.type, var.value))
         else:
-            self.callStack.append((instruction.args[0], instruction.types[0]))
+            self.dataStack.append(instruction.args[0])
 
 
     def POPS(self, instruction):
-        if not self.callStack:
+        if not self.dataStack:
             ErrorMessages.exit_code(56)
 
-        var = self.check_var(instruction.args[0][0], instruction.args[0][1]) 
-        value, type = self.callStack.pop()
-        var.change_value(value, type)
-
+        var = self.check_var(instruction.args[0]) 
+        symb = self.dataStack.pop()
+        var.change_value(symb.value, symb.type)
 
-    def MATH_OPERATIONS(self, instruction : Instruction, operator):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
-        res, op2 = 0, 0
 
-        if instruction.types[1] == "var":     
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            if var.type != "int":
-                ErrorMessages.exit_code(53)
-            res += var.value
-        else:
-            if instruction.types[1] != "int":
-                ErrorMessages.exit_code(53)    
-            res += int(instruction.args[1])
-
-        if instruction.types[2] == "var":     
-            var = self.check_var(instruction.args[2][0], instruction.args[2][1], True)
-            if var.type != "int":
-                ErrorMessages.exit_code(53)
-            op2 = var.value
-        else:
-            if instruction.types[2] != "int":
-                ErrorMessages.exit_code(53)           
-            op2 = int(instruction.args[2])
-
-        # choose operation
+    def calculate(self, operator, op1, op2):
+        """Compute arithmetic operation with integers."""
         if operator == "+":
-            res += op2
+            return op1 + op2
         elif operator == "-":
-            res -= op2
+            return op1 - op2
         elif operator == "*":
-            res *= op2
-        elif operator == "/":
-            if op2 == 0:
-                ErrorMessages.exit_code(57)
-            res //= op2
+            return op1 * op2
 
-        dest.change_value(res, "int")
+        if op2 == 0:
+            ErrorMessages.exit_code(57)
+        return op1 // op2
 
 
-    def COMPARE(self, instruction : Instruction, operator):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
-        val1, type1, val2, type2 = "", "", "", ""
+    def relation(self, operator, symb1, symb2):
+        """Compare two symbols by relational operator."""
+        val1, type1, val2, type2 = symb1.value, symb1.type, symb2.value, symb2.type
 
-        if instruction.types[1] == "var":     
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            val1, type1 = var.value, var.type
-        else:  
-            val1, type1 = instruction.args[1], instruction.types[1]
-            if type1 == "int":
-                val1 = int(val1)
-
-        if instruction.types[2] == "var":     
-            var = self.check_var(instruction.args[2][0], instruction.args[2][1], True)
-            val2, type2 = var.value, var.type
-        else:  
-            val2, type2 = instruction.args[2], instruction.types[2]
-            if type2 == "int":
-                val2 = int(val2)
-
-        res = ""
+        res = False
         if type1 == type2:
-            if type1 == "nil" and operator != "=":
+            if type1 == NIL_TYPE and operator != "=":
                 ErrorMessages.exit_code(53)
             if operator == "<":
                 res = val1 < val2
@@ -374,334 +801,213 @@ class Interpret:
                 res = val1 > val2
             else:
                 res = val1 == val2
-        elif (type1 == "nil" or type2 == "nil") and operator == "=":
+        elif (type1 == NIL_TYPE or type2 == NIL_TYPE) and operator == "=":
             res = False
         else:
             ErrorMessages.exit_code(53)
 
-        dest.change_value(str(res).lower(), "bool")
+        return res
 
 
-    def LOGICAL_OP(self, instruction : Instruction, operator):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
-        op1, op2 = "", ""
+    def logical(self, operator, op1, op2):
+        """Compute logical operation with bools, op2 is ignored by 'not'."""
+        if operator == "not":
+            return not op1
+        elif operator == "and":
+            return op1 and op2
+        return op1 or op2
 
-        if instruction.types[1] == "var":     
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            if var.type != "bool":
-                ErrorMessages.exit_code(53)
-            op1 = var.value
-        else:
-            if instruction.types[1] != "bool":
-                ErrorMessages.exit_code(53)           
-            op1 = instruction.args[1]
 
-        if operator != "not":
-            if instruction.types[2] == "var":     
-                var = self.check_var(instruction.args[2][0], instruction.args[2][1], True)
-                if var.type != "bool":
-                    ErrorMessages.exit_code(53)
-                op2 = var.value
-            else:
-                if instruction.types[2] != "bool":
-                    ErrorMessages.exit_code(53)           
-                op2 = instruction.args[2]
+    def int_to_char(self, code):
+        """Convert Unicode code point to character."""
+        try:
+            return chr(code)
+        except:
+           ErrorMessages.exit_code(58)
 
-        res = "false"
-        if operator == "not" and op1 == "false":
-            res = "true"
-        elif operator == "and":
-            if op1 == "true" and op2 == "true":
-                res = "true"
-        elif operator == "or":
-            if op1 == "true" or op2 == "true":
-                res = "true"
 
-        dest.change_value(res, "bool")
+    def char_code(self, string, pos):
+        """Get Unicode code point of character in string."""
+        if pos < 0 or pos >= len(string):
+            ErrorMessages.exit_code(58)
+        return ord(string[pos])
 
 
-    def INT2CHAR(self, instruction : Instruction):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
-        char = ""
+    def equal_symbols(self, symb1, symb2):
+        """Compare two symbols for conditional jump."""
+        if symb1.type == symb2.type or symb1.type == NIL_TYPE or symb2.type == NIL_TYPE:
+            return symb1.value == symb2.value
+        ErrorMessages.exit_code(53)
 
-        if instruction.types[1] == "var":     
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            if var.type != "int":
-                ErrorMessages.exit_code(53)
-            char = var.value
-        else:
-            if instruction.types[1] != "int":
-                ErrorMessages.exit_code(53)           
-            char = instruction.args[1]
 
-        try:
-            char = chr(int(char))
-        except:
-           ErrorMessages.exit_code(58)
+    def MATH_OPERATIONS(self, instruction : Instruction, operator):
+        dest = self.check_var(instruction.args[0])
+        op1 = self.symb_of_type(instruction.args[1], INT).value
+        op2 = self.symb_of_type(instruction.args[2], INT).value
+        dest.change_value(self.calculate(operator, op1, op2), INT)
 
-        dest.change_value(char, "string")
 
-    
-    def STRI2CHAR(self, instruction : Instruction):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
-        string, pos = "", -1
+    def COMPARE(self, instruction : Instruction, operator):
+        dest = self.check_var(instruction.args[0])
+        symb1 = self.symb(instruction.args[1])
+        symb2 = self.symb(instruction.args[2])
+        dest.change_value(self.relation(operator, symb1, symb2), BOOL)
 
-        if instruction.types[1] == "var":     
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            if var.type != "string":
-                ErrorMessages.exit_code(53)
-            string = var.value
-        else:
-            if instruction.types[1] != "string":
-                ErrorMessages.exit_code(53)           
-            string = instruction.args[1]
 
-        if instruction.types[2] == "var":     
-            var = self.check_var(instruction.args[2][0], instruction.args[2][1], True)
-            if var.type != "int":
-                ErrorMessages.exit_code(53)
-            pos = var.value
-        else:
-            if instruction.types[2] != "int":
-                ErrorMessages.exit_code(53)           
-            pos = int(instruction.args[2])
+    def LOGICAL_OP(self, instruction : Instruction, operator):
+        dest = self.check_var(instruction.args[0])
+        op1 = self.symb_of_type(instruction.args[1], BOOL).value
+        op2 = None
+        if operator != "not":
+            op2 = self.symb_of_type(instruction.args[2], BOOL).value
+        dest.change_value(self.logical(operator, op1, op2), BOOL)
 
-        if pos < 0 or pos >= len(string):
-            ErrorMessages.exit_code(58)
 
-        res = ord(string[pos])
-        dest.change_value(res, "int")
+    def INT2CHAR(self, instruction : Instruction):
+        dest = self.check_var(instruction.args[0])
+        code = self.symb_of_type(instruction.args[1], INT).value
+        dest.change_value(self.int_to_char(code), STRING)
 
     
-    # TODO: EOF
+    def STRI2CHAR(self, instruction : Instruction):
+        dest = self.check_var(instruction.args[0])
+        string = self.string_value(instruction.args[1])
+        pos = self.symb_of_type(instruction.args[2], INT).value
+        dest.change_value(self.char_code(string, pos), INT)
+
+
     def READ(self, instruction : Instruction):
         # check the existence of variable
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
+        dest = self.check_var(instruction.args[0])
         
-        # stdin
-        if self.input == "STDIN":
-            try:
-                uInput = input()
-            except:
-                ErrorMessages.exit_code(11)
-        # from file
-        else:
-            try:
-                with open(self.input) as f:
-                    fileContent = f.read().splitlines()
-            except:
-                ErrorMessages.exit_code(11)
-
-            if len(fileContent) < self.readUsage + 1:
-                dest.change_value("nil", "nil")
-                self.readUsage += 1
-                return
-
-            uInput = fileContent[self.readUsage]
-            self.readUsage += 1
-
-        # remove a trailing newline
-        uInput.rstrip("\n")
+        uInput = self.inputReader.read_line()
         
+        # end of input
+        if uInput is None:
+            dest.change_value(NIL, NIL_TYPE)
+            return
+
         # assign value according to given type
         if instruction.args[1] == "int":
             try:
-                dest.change_value(int(uInput) ,"int")
+                dest.change_value(int(uInput), INT)
             except:
-                dest.change_value("nil", "nil")
+                dest.change_value(NIL, NIL_TYPE)
         elif instruction.args[1] == "bool":
-            if uInput.lower() == "true":
-                dest.change_value("true", "bool")
-            else:
-                dest.change_value("false", "bool")
+            dest.change_value(uInput.lower() == "true", BOOL)
         else:
-            dest.change_value(uInput, "string")
+            dest.change_value(uInput, STRING)
+
+
+    def to_string(self, value):
+        """Convert value to its textual representation."""
+        if value is True:
+            return "true"
+        if value is False:
+            return "false"
+        return str(value)
 
   
     def WRITE(self, instruction : Instruction):
-        string = ""
-        if instruction.types[0] == "var":     
-            var = self.check_var(instruction.args[0][0], instruction.args[0][1], True)
-            if var.type != "nil":
-                string = var.value
-        else:
-            if instruction.types[0] != "nil":
-                string = instruction.args[0]
-
-        print(string, end="")
+        symb = self.symb(instruction.args[0])
+        if symb.type != NIL_TYPE:
+            self.stdout.write(self.to_string(symb.value))
 
     
     def CONCAT(self, instruction : Instruction):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1]) 
-
-        res = ""
-        for i in range(1, 3):
-            if instruction.types[i] == "var":     
-                src = self.check_var(instruction.args[i][0], instruction.args[i][1], True)
-
-                if src.type != "string":
-                    ErrorMessages.exit_code(53)
-                res += src.value
-            else:
-                if instruction.types[i] != "string":
-                    ErrorMessages.exit_code(53)
-                res += instruction.args[i]
-
-        dest.change_value(res, "string") 
+        dest = self.check_var(instruction.args[0]) 
+        
+        # appending to long string in the destination itself
+        symb1 = instruction.args[1]
+        if (symb1.__class__ is VarRef and dest.type == STRING and len(dest.value) >= StringBuffer.THRESHOLD
+                and self.frames.find_var(symb1) is dest):
+            string = self.symb_of_type(instruction.args[2], STRING).value
+            buffer = dest.value
+            if buffer.__class__ is not StringBuffer:
+                buffer = StringBuffer(buffer)
+            buffer.append(string)
+            dest.value = buffer
+            return
+
+        res = self.symb_of_type(instruction.args[1], STRING).value
+        res += self.symb_of_type(instruction.args[2], STRING).value
+        dest.change_value(res, STRING) 
 
 
     def STRLEN(self, instruction : Instruction):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
-
-        res = 0
-        if instruction.types[1] == "var":     
-            src = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-
-            if src.type != "string":
-                ErrorMessages.exit_code(53)
-            res = len(src.value)
-        else:
-            if instruction.types[1] != "string":
-                ErrorMessages.exit_code(53)
-            res = len(instruction.args[1])
-
-        dest.change_value(res, "int")
+        dest = self.check_var(instruction.args[0])
+        res = len(self.string_value(instruction.args[1]))
+        dest.change_value(res, INT)
 
 
     def GETCHAR(self, instruction : Instruction):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1])
-        string, pos = "", -1
-
-        if instruction.types[1] == "var":     
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            if var.type != "string":
-                ErrorMessages.exit_code(53)
-            string = var.value
-        else:
-            if instruction.types[1] != "string":
-                ErrorMessages.exit_code(53)           
-            string = instruction.args[1]
-
-        if instruction.types[2] == "var":     
-            var = self.check_var(instruction.args[2][0], instruction.args[2][1], True)
-            if var.type != "int":
-                ErrorMessages.exit_code(53)
-            pos = var.value
-        else:
-            if instruction.types[2] != "int":
-                ErrorMessages.exit_code(53)           
-            pos = int(instruction.args[2])
+        dest = self.check_var(instruction.args[0])
+        string = self.string_value(instruction.args[1])
+        pos = self.symb_of_type(instruction.args[2], INT).value
 
         if pos < 0 or pos >= len(string):
             ErrorMessages.exit_code(58)
 
         res = string[pos]
-        dest.change_value(res, "string")
+        dest.change_value(res, STRING)
 
 
     def SETCHAR(self, instruction : Instruction):
-        dest = self.check_var(instruction.args[0][0], instruction.args[0][1], True)
-        if dest.type != "string":
+        dest = self.check_var(instruction.args[0])
+        if dest.value is None:
+            ErrorMessages.exit_code(56)
+        if dest.type != STRING:
             ErrorMessages.exit_code(53)
 
-        string, pos = "", -1
-        if instruction.types[1] == "var":     
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            if var.type != "int":
-                ErrorMessages.exit_code(53)
-            pos = var.value
-        else:
-            if instruction.types[1] != "int":
-                ErrorMessages.exit_code(53)           
-            pos = int(instruction.args[1])
+        pos = self.symb_of_type(instruction.args[1], INT).value
+        string = self.symb_of_type(instruction.args[2], STRING).value
 
-        if instruction.types[2] == "var":     
-            var = self.check_var(instruction.args[2][0], instruction.args[2][1], True)
-            if var.type != "string":
-                ErrorMessages.exit_code(53)
-            string = var.value
-        else:
-            if instruction.types[2] != "string":
-                ErrorMessages.exit_code(53)           
-            string = instruction.args[2]
-
-        if string == "" or pos < 0 or pos >= len(dest.value):
+        buffer = dest.value
+        if string == "" or pos < 0 or pos >= len(buffer):
             ErrorMessages.exit_code(58)
 
-        if pos == len(dest.value) - 1:
-            res = dest.value[:pos] + string[0]
+        if buffer.__class__ is StringBuffer:
+            buffer[pos] = string[0]
+        elif len(buffer) >= StringBuffer.THRESHOLD:
+            # following changes of long string are made in place
+            buffer = StringBuffer(buffer)
+            buffer[pos] = string[0]
+            dest.value = buffer
         else:
-            res = dest.value[:pos] + string[0] + dest.value[pos+1:]
-        dest.change_value(res, "string")
+            dest.change_value(buffer[:pos] + string[0] + buffer[pos+1:], STRING)
 
 
     def TYPE(self, instruction : Instruction):
-        varType = ""
         if instruction.types[1] == "var":     
-            tmp = self.check_var(instruction.args[1][0], instruction.args[1][1])
-            
-            if tmp.type:
-                varType = tmp.type
+            varType = self.check_var(instruction.args[1]).type
         else:
-            varType = instruction.types[1]
+            varType = instruction.args[1].type
+        # uninitialized variable has empty type
+        varType = TYPE_NAMES.get(varType, "")
 
-        var = self.check_var(instruction.args[0][0], instruction.args[0][1])           
-        var.change_value(varType, "string")
+        var = self.check_var(instruction.args[0])           
+        var.change_value(varType, STRING)
 
 
-    def check_label(self, label):
-        if label not in self.labels:
-            ErrorMessages.exit_code(52)
+    def LABEL(self, instruction : Instruction):
+        pass
 
-    
-    def JUMP(self, label):
-        self.check_label(label)
-        self.instructionCounter = self.labels[label] - 1
+
+    def JUMP(self, instruction : Instruction):
+        self.instructionCounter = instruction.target
 
     
     def JUMPIF(self, instruction : Instruction, equal):       
-        type1, type2, value1, value2 = None, None, None, None
-
-        self.check_label(instruction.args[0])
-        
-        if instruction.types[1] == "var":
-            var = self.check_var(instruction.args[1][0], instruction.args[1][1], True)
-            type1, value1 = var.type, var.value
-        else:
-            type1, value1 = instruction.types[1], instruction.args[1]
-            if type1 == "int":
-                value1 = int(value1)
-
-        if instruction.types[2] == "var":
-            var = self.check_var(instruction.args[2][0], instruction.args[2][1], True)
-            type2, value2 = var.type, var.value
-        else:
-            type2, value2 = instruction.types[2], instruction.args[2]
-            if type2 == "int":
-                value2 = int(value2)
-
-        if type1 == type2 or type1 == "nil" or type2 == "nil":
-            if (equal and value1 == value2) or (not equal and value1 != value2):
-                self.JUMP(instruction.args[0])
-        else:
-            ErrorMessages.exit_code(53)
+        symb1 = self.symb(instruction.args[1])
+        symb2 = self.symb(instruction.args[2])
+        if self.equal_symbols(symb1, symb2) == equal:
+            self.instructionCounter = instruction.target
 
 
     def EXIT_PRG(self, instruction : Instruction):
-        if instruction.types[0] == "var":     
-            var = self.check_var(instruction.args[0][0], instruction.args[0][1], True)    
-            
-            if var.type == "int":
-                if var.value >= 0 and var.value <= 49:
-                    exit(var.value)
-            else:
-                ErrorMessages.exit_code(53)
-        else:
-            if instruction.types[0] == "int":
-                if int(instruction.args[0]) >= 0 and int(instruction.args[0]) <= 49:
-                    exit(int(instruction.args[0]))
-            else:
-                ErrorMessages.exit_code(53)
+        code = self.symb_of_type(instruction.args[0], INT).value
+        if code >= 0 and code <= 49:
+            ErrorMessages.exit_program(code)
 
         ErrorMessages.exit_code(57)
 
@@ -709,177 +1015,255 @@ class Interpret:
     def DPRINT(self, instruction):
         string = ""
         if instruction.types[0] == "var":     
-            var = self.check_var(instruction.args[0][0], instruction.args[0][1], True)
-            string = var.value
-        else:
-            if instruction.types[0] != "nil":
-                string = instruction.args[0]
+            var = self.check_var(instruction.args[0], True)
+            string = self.to_string(var.value)
+        elif instruction.types[0] != "nil":
+            string = self.to_string(instruction.args[0].value)
 
-        print(string, file=sys.stderr)    
+        self.stderr.write(string + "\n")
 
     
-    def BREAK_PRG(self):
+    def BREAK_PRG(self, instruction : Instruction):
+        self.stderr.flush()
         print("Instruction counter:", self.instructionCounter, file=sys.stderr)
-        print("GF:", self.frames.globalFrame, file=sys.stderr)
-        print("TF:", self.frames.tmpFrame, file=sys.stderr)
-        print("LF:", self.frames, file=sys.stderr)
+        print("GF:", self.frames.dump_global_frame(), file=sys.stderr)
+        print("TF:", self.frames.dump_frame(self.frames.tmpFrame), file=sys.stderr)
+        print("LF:", [self.frames.dump_frame(frame) for frame in self.frames.framesStack], file=sys.stderr)
         print("Labels list:", self.labels,file=sys.stderr)
 
 
-    def interpret_code(self):
-        while self.instructionCounter < len(self.instructionsArray):
-            instruction = self.instructionsArray[self.instructionCounter]
-            opcode = instruction.opcode
-            
-            # MOVE
-            if opcode == "MOVE":
-                self.MOVE(instruction)
-            
-            # CREATEFRAME
-            elif opcode == "CREATEFRAME":
-                self.frames.create_frame()
-            
-            # PUSHFRAME
-            elif opcode == "PUSHFRAME":
-                self.frames.push_frame()
-
-            # POPFRAME
-            elif opcode == "POPFRAME":
-                self.frames.pop_frame()
-
-            # DEFVAR
-            elif opcode == "DEFVAR":
-                self.frames.add_var(instruction.args[0][0], instruction.args[0][1])
-
-            # CALL
-            elif opcode == "CALL":
-                self.callStack.append(self.instructionCounter+1)
-                self.JUMP(instruction.args[0])
-
-            # RETURN
-            elif opcode == "RETURN":
-                self.RETURN_PRG()
-                continue
+    ########################################
+    ###### METHODS for STACK OPCODES #######
+    ########################################
 
-            # PUSHS
-            elif opcode == "PUSHS":
-                self.PUSHS(instruction)
-                    
-            # POPS
-            elif opcode == "POPS":
-                self.POPS(instruction)
-            
-            # ADD
-            elif opcode == "ADD":
-                self.MATH_OPERATIONS(instruction, "+")
+    def pop_operands(self, count):
+        """Pop operands of stack instruction in order of their pushing."""
+        if len(self.dataStack) < count:
+            ErrorMessages.exit_code(56)
 
-            # SUB
-            elif opcode == "SUB":
-                self.MATH_OPERATIONS(instruction, "-")
-            
-            # MUL
-            elif opcode == "MUL":
-                self.MATH_OPERATIONS(instruction, "*")
-            
-            # IDIV
-            elif opcode == "IDIV":
-                self.MATH_OPERATIONS(instruction, "/")
-            
-            # LT
-            elif opcode == "LT":
-                self.COMPARE(instruction, "<")
-            
-            # GT
-            elif opcode == "GT":
-                self.COMPARE(instruction, ">")
-            
-            # EQ
-            elif opcode == "EQ":
-                self.COMPARE(instruction, "=")
-            
-            # AND
-            elif opcode == "AND":
-                self.LOGICAL_OP(instruction, "and")
-            
-            # OR
-            elif opcode == "OR":
-                self.LOGICAL_OP(instruction, "or")
-            
-            # NOT
-            elif opcode == "NOT":
-                self.LOGICAL_OP(instruction, "not")
-            
-            # INT2CHAR
-            elif opcode == "INT2CHAR":
-                self.INT2CHAR(instruction)
-            
-            # STR2INT
-            elif opcode == "STRI2INT":
-                self.STRI2CHAR(instruction)
+        operands = self.dataStack[-count:]
+        del self.dataStack[-count:]
+        return operands
 
-            # READ
-            elif opcode == "READ":
-                self.READ(instruction)
 
-            # WRITE
-            elif opcode == "WRITE":
-                self.WRITE(instruction)
+    def check_types(self, type, *symbols):
+        """Check types of popped operands."""
+        for symb in symbols:
+            if symb.type != type:
+                ErrorMessages.exit_code(53)
 
-            # CONCAT
-            elif opcode == "CONCAT":
-                self.CONCAT(instruction)
 
-            # STRLEN
-            elif opcode == "STRLEN":
-                self.STRLEN(instruction)
+    def CLEARS(self, instruction : Instruction):
+        self.dataStack.clear()
 
-            # GETCHAR
-            elif opcode == "GETCHAR":
-                self.GETCHAR(instruction)
 
-            # SETCHAR
-            elif opcode == "SETCHAR":
-                self.SETCHAR(instruction)
+    def STACK_MATH_OPERATIONS(self, instruction : Instruction, operator):
+        symb1, symb2 = self.pop_operands(2)
+        self.check_types(INT, symb1, symb2)
+        self.dataStack.append(Const(INT, self.calculate(operator, symb1.value, symb2.value)))
 
-            # TYPE
-            elif opcode == "TYPE":
-                self.TYPE(instruction)
-            
-            # LABEL
-            elif opcode == "LABEL":
-                pass
 
-            # JUMP
-            elif opcode == "JUMP":
-                self.JUMP(instruction.args[0])
+    def STACK_COMPARE(self, instruction : Instruction, operator):
+        symb1, symb2 = self.pop_operands(2)
+        self.dataStack.append(TRUE if self.relation(operator, symb1, symb2) else FALSE)
+
+
+    def STACK_LOGICAL_OP(self, instruction : Instruction, operator):
+        if operator == "not":
+            symb1, = self.pop_operands(1)
+            self.check_types(BOOL, symb1)
+            op2 = None
+        else:
+            symb1, symb2 = self.pop_operands(2)
+            self.check_types(BOOL, symb1, symb2)
+            op2 = symb2.value
+        self.dataStack.append(TRUE if self.logical(operator, symb1.value, op2) else FALSE)
+
+
+    def INT2CHARS(self, instruction : Instruction):
+        symb, = self.pop_operands(1)
+        self.check_types(INT, symb)
+        self.dataStack.append(Const(STRING, self.int_to_char(symb.value)))
+
+
+    def STRI2INTS(self, instruction : Instruction):
+        symb1, symb2 = self.pop_operands(2)
+        self.check_types(STRING, symb1)
+        self.check_types(INT, symb2)
+        self.dataStack.append(Const(INT, self.char_code(symb1.value, symb2.value)))
+
+
+    def STACK_JUMPIF(self, instruction : Instruction, equal):
+        symb1, symb2 = self.pop_operands(2)
+        if self.equal_symbols(symb1, symb2) == equal:
+            self.instructionCounter = instruction.target
+
+
+    ########################################
+    ### METHODS for SUPERINSTRUCTIONS ######
+    ########################################
 
-            # JUMPIFEQ
-            elif opcode == "JUMPIFEQ":
-                self.JUMPIF(instruction, True)
+    def DEFVAR_MOVE(self, instruction : Instruction):
+        dest = self.frames.add_var(instruction.args[0])
+        src = self.symb(instruction.args[1])
+        dest.change_value(src.value, src.type)
 
-            # JUMPIFNEQ
-            elif opcode == "JUMPIFNEQ":
-                self.JUMPIF(instruction, False)
 
-            # EXIT
-            elif opcode == "EXIT":
-                self.EXIT_PRG(instruction)
+    def PUSHS_POPS(self, instruction : Instruction):
+        src = self.symb(instruction.args[1])
+        dest = self.check_var(instruction.args[0])
+        dest.change_value(src.value, src.type)
 
-            # DRPINT
-            elif opcode == "DPRINT":
-                self.DPRINT(instruction)
 
-            # BREAK
-            elif opcode == "BREAK":
-                self.BREAK_PRG()
+    def COMPARE_JUMP(self, instruction : Instruction, operator):
+        dest = self.check_var(instruction.args[0])
+        symb1 = self.symb(instruction.args[1])
+        symb2 = self.symb(instruction.args[2])
+        res = self.relation(operator, symb1, symb2)
+        dest.change_value(res, BOOL)
+        if res == instruction.args[3]:
+            self.instructionCounter = instruction.target
 
+
+    ########################################
+    ### METHODS for TYPED INSTRUCTIONS #####
+    ########################################
+
+    # Operands <symb> are constants or GF variables with proven type
+    # and value, both are read directly through attribute 'value'.
+
+    def TYPED_MATH_OPERATIONS(self, instruction : Instruction, operator):
+        dest = self.check_var(instruction.args[0])
+        args = instruction.args
+        dest.change_value(self.calculate(operator, args[1].value, args[2].value), INT)
+
+
+    def TYPED_COMPARE(self, instruction : Instruction, relation):
+        dest = self.check_var(instruction.args[0])
+        args = instruction.args
+        dest.change_value(relation(args[1].value, args[2].value), BOOL)
+
+
+    def TYPED_LOGICAL_OP(self, instruction : Instruction, operator):
+        dest = self.check_var(instruction.args[0])
+        args = instruction.args
+        op2 = args[2].value if operator != "not" else None
+        dest.change_value(self.logical(operator, args[1].value, op2), BOOL)
+
+
+    def TYPED_CONCAT(self, instruction : Instruction):
+        dest = self.check_var(instruction.args[0])
+        args = instruction.args
+        dest.change_value(args[1].value + args[2].value, STRING)
+
+
+    def TYPED_STRLEN(self, instruction : Instruction):
+        dest = self.check_var(instruction.args[0])
+        dest.change_value(len(instruction.args[1].value), INT)
+
+
+    def TYPED_GETCHAR(self, instruction : Instruction):
+        dest = self.check_var(instruction.args[0])
+        string, pos = instruction.args[1].value, instruction.args[2].value
+        if pos < 0 or pos >= len(string):
+            ErrorMessages.exit_code(58)
+        dest.change_value(string[pos], STRING)
+
+
+    def TYPED_STRI2CHAR(self, instruction : Instruction):
+        dest = self.check_var(instruction.args[0])
+        args = instruction.args
+        dest.change_value(self.char_code(args[1].value, args[2].value), INT)
+
+
+    def TYPED_JUMPIF(self, instruction : Instruction, equal):
+        args = instruction.args
+        if (args[1].value == args[2].value) == equal:
+            self.instructionCounter = instruction.target
+
+
+    def TYPED_COMPARE_JUMP(self, instruction : Instruction, relation):
+        dest = self.check_var(instruction.args[0])
+        args = instruction.args
+        res = relation(args[1].value, args[2].value)
+        dest.change_value(res, BOOL)
+        if res == args[3]:
+            self.instructionCounter = instruction.target
+
+
+    def interpret_code(self):
+        """Execute the compiled instructions one by one."""
+        code = self.instructionsArray
+        length = len(code)
+
+        self.stdout = OutputBuffer(sys.stdout, self.outputThreshold)
+        self.stderr = OutputBuffer(sys.stderr, self.outputThreshold)
+
+        if self.sampler is not None:
+            self.sampler.start(self)
+
+        if self.profiler is not None:
+            self.profile_code()
+        elif self.blocks is not None:
+            self.execute_blocks()
+        
+        while self.instructionCounter < length:
+            code[self.instructionCounter].handler()
             self.instructionCounter += 1
         
-        exit(0)
+        ErrorMessages.exit_program(0)
+
+
+    def profile_code(self):
+        """Execute instructions one by one and measure them by profiler."""
+        code = self.instructionsArray
+        length = len(code)
+        profiler = self.profiler
+        profiler.start(code)
+        counts, times = profiler.counts, profiler.times
+
+        while self.instructionCounter < length:
+            position = self.instructionCounter
+            instruction = code[position]
+            counts[position] += 1
+            start = perf_counter()
+            instruction.handler()
+            end = perf_counter()
+            times[position] += end - start
+
+            if instruction.opcode == "CALL":
+                profiler.enter(instruction.args[0], end)
+            elif instruction.opcode == "RETURN":
+                profiler.leave(end)
+            self.instructionCounter += 1
+
+
+    def execute_blocks(self):
+        """Execute compiled blocks, every block returns position of the next one."""
+        blocks = self.blocks
+        length = len(blocks)
+        position = 0
+
+        while position < length:
+            position = blocks[position]()
+        self.instructionCounter = position
 
 
 if __name__ == "__main__":
     interpret = Interpret()
     interpret.load_args()
+    # loaded program lives until the end, garbage collection
+    # would only repeatedly traverse it during loading
+    gc.disable()
     interpret.load_source_code()
+    interpret.resolve_labels()
+    interpret.resolve_variables()
+    if interpret.optimize:
+        interpret.optimize_code()
+    interpret.compile_instructions()
+    # profiler measures single instructions, compiled blocks are not used
+    if interpret.compileBlocks and interpret.profiler is None:
+        interpret.compile_blocks()
+    gc.freeze()
+    gc.enable()
     interpret.interpret_code()
\ No newline at end of file
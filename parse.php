@@ -16,6 +16,79 @@ ini_set('display_errors', 'stderr');
  */
 class InstructionParser
 {
+    // opcode => kinds of arguments
+    const OPCODES = [
+        // zero args
+        "CREATEFRAME" => [],
+        "PUSHFRAME" => [],
+        "POPFRAME" => [],
+        "RETURN" => [],
+        "BREAK" => [],
+        // stack opcodes
+        "CLEARS" => [],
+        "ADDS" => [],
+        "SUBS" => [],
+        "MULS" => [],
+        "IDIVS" => [],
+        "LTS" => [],
+        "GTS" => [],
+        "EQS" => [],
+        "ANDS" => [],
+        "ORS" => [],
+        "NOTS" => [],
+        "INT2CHARS" => [],
+        "STRI2INTS" => [],
+        // <label>
+        "LABEL" => ["label"],
+        "JUMP" => ["label"],
+        "CALL" => ["label"],
+        "JUMPIFEQS" => ["label"],
+        "JUMPIFNEQS" => ["label"],
+        // <symb>
+        "EXIT" => ["symb"],
+        "DPRINT" => ["symb"],
+        "WRITE" => ["symb"],
+        "PUSHS" => ["symb"],
+        // <var>
+        "DEFVAR" => ["var"],
+        "POPS" => ["var"],
+        // <var> <symb>
+        "MOVE" => ["var", "symb"],
+        "TYPE" => ["var", "symb"],
+        "STRLEN" => ["var", "symb"],
+        "INT2CHAR" => ["var", "symb"],
+        "NOT" => ["var", "symb"],
+        // <var> <type>
+        "READ" => ["var", "type"],
+        // <label> <symb> <symb> jumps
+        "JUMPIFEQ" => ["label", "symb", "symb"],
+        "JUMPIFNEQ" => ["label", "symb", "symb"],
+        // <var> <symb> <symb>
+        "AND" => ["var", "symb", "symb"],
+        "OR" => ["var", "symb", "symb"],
+        "LT" => ["var", "symb", "symb"],
+        "GT" => ["var", "symb", "symb"],
+        "EQ" => ["var", "symb", "symb"],
+        "IDIV" => ["var", "symb", "symb"],
+        "MUL" => ["var", "symb", "symb"],
+        "SUB" => ["var", "symb", "symb"],
+        "ADD" => ["var", "symb", "symb"],
+        "STRI2INT" => ["var", "symb", "symb"],
+        "CONCAT" => ["var", "symb", "symb"],
+        "GETCHAR" => ["var", "symb", "symb"],
+        "SETCHAR" => ["var", "symb", "symb"]
+    ];
+
+    const LABEL_REGEX = '/^[a-zA-Z_\-$&%*!?][0-9a-zA-Z_\-$&%*!?]*$/';
+    const VAR_REGEX = '/^(GF|LF|TF)@[a-zA-Z_\-$&%*!?]\S*$/';
+    const TYPE_REGEX = '/^(int|string|nil|bool)$/';
+    // variable or constant, groups 1-8 are pairs of type and value of constant
+    const SYMB_REGEX = '/^(?:(?:GF|LF|TF)@[a-zA-Z_\-$&%*!?]\S*'
+        . '|(nil)@(nil)'
+        . '|(bool)@(true|false)'
+        . '|(int)@([\-+][1-9][0-9]*|[1-9][0-9]*|0)'
+        . '|(string)@((?:[^\\\\\s#]|\\\\\d{3})*))$/';
+
     // instruction
     private $opcode;
     // instruction's arguments
@@ -77,104 +150,14 @@ class InstructionParser
 
         $this->opcode = strtoupper($separatedItems[0]);
 
-        switch ($this->opcode) {
-            // zero args
-            case "CREATEFRAME":
-            case "PUSHFRAME":
-            case "POPFRAME":
-            case "RETURN":
-            case "BREAK":
-                if (count($separatedItems) !== 1)
-                {
-                    return false;
-                }
-                $this->args = [];
-                break;
-            // <label>
-            case "LABEL":
-            case "JUMP":
-            case "CALL":
-                if (count($separatedItems) !== 2)
-                {
-                    return false;
-                }
-                $this->args = ["label"];
-                break;
-            // <symb>
-            case "EXIT":
-            case "DPRINT":
-            case "WRITE":
-            case "PUSHS":
-                if (count($separatedItems) !== 2)
-                {
-                    return false;
-                }
-                $this->args = ["symb"];
-                break;
-            // <var>
-            case "DEFVAR":
-            case "POPS":
-                if (count($separatedItems) !== 2)
-                {
-                    return false;
-                }
-                $this->args = ["var"];
-                break;
-            // <var> <symb>
-            case "MOVE":
-			case "TYPE":
-            case "STRLEN":
-            case "INT2CHAR":
-            case "NOT":
-                if (count($separatedItems) !== 3)
-                {
-                    return false;
-                }
-                $this->args = ["var", "symb"];
-                break;
-            // <var> <type>
-            case "READ":
-                if (count($separatedItems) !== 3)
-                {
-                    return false;
-                }
-                $this->args = ["var", "type"];
-                break;
-            // <label> <symb> <symb> jumps
-            case "JUMPIFEQ":
-            case "JUMPIFNEQ":
-                if (count($separatedItems) !== 4)
-                {
-                    return false;
-                }
-                $this->args = ["label", "symb", "symb"];
-                break;
-            // <var> <symb> <symb>
-            case "AND":
-            case "OR":
-            case "LT":
-            case "GT":
-            case "EQ":
-            case "IDIV":
-            case "MUL":
-            case "SUB":
-            case "ADD":
-            case "STRI2INT":
-			case "CONCAT":
-			case "GETCHAR":
-			case "SETCHAR":
-                if (count($separatedItems) !== 4)
-                {
-                    return false;
-                }
-                $this->args = ["var", "symb", "symb"];
-                break;
-            default:
-                fprintf(STDERR, "ERROR: Unknown opcode!");
-                exit(22);
+        if (!isset(self::OPCODES[$this->opcode]))
+        {
+            fprintf(STDERR, "ERROR: Unknown opcode!");
+            exit(22);
         }
+        $this->args = self::OPCODES[$this->opcode];
 
-        return true;
+        return count($separatedItems) === count($this->args) + 1;
     }
 
     /**
@@ -187,93 +170,51 @@ class InstructionParser
     {
         // generate opcode instruction
         XMLFileWriter::addInstruction($this->opcode);
-        
-        // only opcode
-        if (count($this->args) == 0)
-        {
-            XMLFileWriter::endElement();
-        }
-        else
+
+        foreach ($this->args as $i => $arg)
         {
-            $pos = 1;
-            foreach($this->args as $arg)
+            $pos = $i + 1;
+            $item = $separatedItems[$pos];
+
+            if ($arg == "label")
             {
-                if ($arg == "label")
-                {
-                    if (!preg_match("/^[a-zA-Z\_\-$&%\*\!\?][0-9a-zA-Z\_\-$&%\*\!\?]*$/", $separatedItems[$pos]))
-                        return false;
-                    
-                    XMLFileWriter::addArg($pos, $arg, $separatedItems[$pos]);
-                }
-                else if ($arg == "var" || ($arg == "symb" && preg_match("/^(GF|LF|TF)/", $separatedItems[$pos])))
-                {
-                    if (!preg_match("/^(GF|LF|TF)@[a-zA-Z\_\-$&%\*\!\?](\S*)$/", $separatedItems[$pos]))
-                        return false;
+                if (!preg_match(self::LABEL_REGEX, $item))
+                    return false;
+                XMLFileWriter::addArg($pos, $arg, $item);
+            }
+            else if ($arg == "var")
+            {
+                if (!preg_match(self::VAR_REGEX, $item))
+                    return false;
+                XMLFileWriter::addArg($pos, $arg, $item);
+            }
+            else if ($arg == "type")
+            {
+                if (!preg_match(self::TYPE_REGEX, $item))
+                    return false;
+                XMLFileWriter::addArg($pos, $arg, $item);
+            }
+            else
+            {
+                if (!preg_match(self::SYMB_REGEX, $item, $match, PREG_UNMATCHED_AS_NULL))
+                    return false;
 
-                    XMLFileWriter::addArg($pos, "var", $separatedItems[$pos]);
-                }
-				else if($arg == "type")
-				{
-					if (!preg_match("/^(int|string|nil|bool)$/", $separatedItems[$pos]))
-					{
-						return false;	
-					}
-                    XMLFileWriter::addArg($pos, $arg, $separatedItems[$pos]);
-				}
-                else if($arg == "symb") 
+                // constant has type and value in one pair of groups, variable in none
+                $type = "var";
+                $value = $item;
+                for ($group = 1; $group < 9; $group += 2)
                 {
-                    $separated = explode('@', $separatedItems[$pos], 2);
-                    if (count($separated) !== 2)
-                        return false;
-                    
-                    if ($separated[0] == 'nil')
+                    if (isset($match[$group]))
                     {
-                        if ($separated[1] !== 'nil')
-                        {
-                            return false;
-                        }
+                        $type = $match[$group];
+                        $value = $match[$group + 1] ?? "";
+                        break;
                     }
-                    else if ($separated[0] == 'string')
-                    {
-                        if (!preg_match("/^([^\\\\\s#]|\\\\\d{3})*$/", $separated[1]))
-                        {
-                            return false;
-                        }
-						else
-						{
-							preg_replace("/</", "&lt", $separated[1]);
-							preg_replace("/>/", "&gt", $separated[1]);
-							preg_replace("/&/", "&amp", $separated[1]);
-                            preg_replace("/\"/", "&quot", $separated[1]);
-                            preg_replace("/\'/", "&apos", $separated[1]);
-						}
-                    }
-                    else if ($separated[0] == 'int')
-                    {
-                        if (!preg_match("/^[\-\+][1-9]+[0-9]*$|^[1-9][0-9]*$|^0$/", $separated[1]))
-                        {
-                            return false;
-                        }
-                    }
-                    else if ($separated[0] == 'bool')
-                    {
-                        if (!preg_match("/^(true|false)$/", $separated[1]))
-                        {
-                            return false;
-                        } 
-                    }
-                    else
-                    {
-                        return false;
-                    }
-
-                    XMLFileWriter::addArg($pos, $separated[0], $separated[1]);
                 }
-
-                $pos++;
+                XMLFileWriter::addArg($pos, $type, $value);
             }
-			XMLFileWriter::endElement();
         }
+        XMLFileWriter::endElement();
 
         return true;
     }
@@ -282,16 +223,18 @@ class InstructionParser
 
 /**
  * @brief Loads and checks program arguments
+ * 
+ * @return true if XML is streamed directly to STDOUT
  */
 function loadArguments()
 {
     global $argc;
 
-    $args = getopt("", ["help"]);
+    $args = getopt("", ["help", "stream"]);
     
     if ($argc == 1)
     {
-        return;
+        return false;
     }
     else if($argc == 2)
     {
@@ -301,10 +244,16 @@ function loadArguments()
             print("checks lexical and syntactic correctness.\n");
             print("\nUsage:   php parser.php\n");
             print("         php parser.php --help\n");
+            print("         php parser.php --stream\n");
             print("Options:\n");
             print("         --help: print help and exit program\n");
+            print("         --stream: write XML continuously, output is incomplete on error\n");
             exit(0);
         }
+        else if (array_key_exists("stream", $args))
+        {
+            return true;
+        }
         else
         {
             fprintf(STDERR, "ERROR: Bad arguments");
@@ -315,33 +264,27 @@ function loadArguments()
 
 /**
 * @brief Load and process source code from stdin
+* 
+* @param bool $stream - write XML directly to STDOUT
 */
-function loadSourceCode()
+function loadSourceCode($stream)
 {
-    XMLFileWriter::XMLFileWriter();
+    XMLFileWriter::XMLFileWriter($stream);
     $instructionParser = new InstructionParser();
     
     while ($line = fgets(STDIN))
-    {        
-        // remove comments
-        $line = preg_replace('/#.*/', '', $line);
-        
-		// replace multiple spaces with one and remove space from the end
-        $line = preg_replace('/\s+/', ' ', $line);
-        if (strlen($line) > 0 && $line[strlen($line)-1] == ' ')
-        {
-            $line = rtrim($line, ' ');
-        }
-        // remove space from the beginning
-        if (strlen($line) > 0 && $line[0] == ' ')
+    {
+        // remove comment
+        $comment = strpos($line, '#');
+        if ($comment !== false)
         {
-            $line = ltrim($line, ' ');
+            $line = substr($line, 0, $comment);
         }
 
         // only if line contains header of some code
-        if (strlen($line) > 0)
+        $separatedItems = preg_split('/\s+/', $line, -1, PREG_SPLIT_NO_EMPTY);
+        if (!empty($separatedItems))
         {
-            $separatedItems = explode(' ', $line);
             $instructionParser->checkSyntax($separatedItems);
         }
     }
@@ -354,6 +297,6 @@ function loadSourceCode()
     XMLFileWriter::endXMLBody();
 }
 
-loadArguments();
-loadSourceCode();
+$stream = loadArguments();
+loadSourceCode($stream);
 ?>
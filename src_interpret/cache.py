@@ -0,0 +1,193 @@
+##
+#   @file cache.py
+#
+#   @brief Cache of loaded and validated programs
+#   @author Patrik Sehnoutek, xsehno01
+#
+
+import hashlib, json, os, stat, tempfile
+
+from .components import *
+
+
+class ProgramCache:
+    """On-disk cache of instruction array and labels.
+
+    Entries are keyed by hash of the source file together with hash
+    of the interpreter's own sources, so any change of either
+    of them makes old entries unused. Entries are JSON files, which
+    are loaded only if they belong to the current user and nobody
+    else can write them. At most MAX_ENTRIES entries are kept,
+    the least recently used ones are removed first.
+    """
+    # version of cache entries format
+    FORMAT = b"2"
+    # size of chunks for hashing source file
+    CHUNK_SIZE = 1 << 20
+    # maximum number of entries in cache directory
+    MAX_ENTRIES = 256
+    # operand type -> type tag of constant
+    CONST_TYPES = {"int" : INT, "bool" : BOOL, "string" : STRING, "nil" : NIL_TYPE}
+    # type tag -> Python type of constant value
+    VALUE_TYPES = {INT : int, BOOL : bool, STRING : str}
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "ipp-interpret")
+        self.directory = directory
+        self.version = self.interpreter_version()
+
+    def interpreter_version(self):
+        """Hash sources of the interpreter."""
+        digest = hashlib.sha256(self.FORMAT)
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        files = [os.path.join(root, "interpret.py")]
+        package = os.path.join(root, "src_interpret")
+        files += sorted(os.path.join(package, name) for name in os.listdir(package) if name.endswith(".py"))
+
+        for name in files:
+            try:
+                with open(name, "rb") as f:
+                    digest.update(f.read())
+            except OSError:
+                pass
+        return digest.digest()
+
+    def hash_source(self, source, sourceFormat="xml"):
+        """Compute key of the source file in given format.
+
+        Standard input is not cached, it would have to be read
+        whole into memory before parsing.
+
+            :return: key of cache entry | None
+        """
+        digest = hashlib.sha256(self.version)
+        digest.update(sourceFormat.encode())
+
+        try:
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        except OSError:
+            # error is reported by parser
+            return None
+
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def load(self, key):
+        """Load cached program.
+
+            :return: instructions, labels | None if not cached
+        """
+        if key is None:
+            return None
+
+        try:
+            with open(self.path(key), "rb") as f:
+                info = os.fstat(f.fileno())
+                if hasattr(os, "getuid") and info.st_uid != os.getuid():
+                    return None
+                if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                    return None
+                entry = json.load(f)
+            program = self.decode(entry)
+            # entry is used, it is removed as the last one
+            os.utime(self.path(key))
+        except Exception:
+            return None
+        return program
+
+    def save(self, key, instructions, labels):
+        """Save program, cache is only optimization so errors are ignored."""
+        if key is None:
+            return
+
+        tmpName = None
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            fd, tmpName = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.encode(instructions, labels), f, separators=(",", ":"))
+            os.replace(tmpName, self.path(key))
+            self.evict()
+        except Exception:
+            try:
+                os.remove(tmpName)
+            except Exception:
+                pass
+
+    def evict(self):
+        """Remove the least recently used entries over MAX_ENTRIES."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.MAX_ENTRIES)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def encode(self, instructions, labels):
+        """Convert loaded program to JSON data."""
+        code = []
+        for instruction in instructions:
+            args = []
+            for type, arg in zip(instruction.types, instruction.args):
+                # constants are stored without their shared objects
+                if type in self.CONST_TYPES:
+                    arg = None if type == "nil" else arg.value
+                args.append(arg)
+            code.append([instruction.order, instruction.opcode, instruction.types, args])
+        return {"code" : code, "labels" : labels}
+
+    def decode(self, entry):
+        """Convert JSON data to program, invalid data raise exception.
+
+            :return: instructions, labels
+        """
+        instructions = []
+        for order, opcode, types, args in entry["code"]:
+            if type(order) is not int or type(opcode) is not str or len(types) != len(args):
+                raise ValueError("invalid instruction")
+
+            instruction = Instruction()
+            instruction.order = order
+            instruction.opcode = opcode
+            for argType, arg in zip(types, args):
+                instruction.args.append(self.decode_argument(argType, arg))
+                instruction.types.append(argType)
+            instruction.no_args = len(args)
+            instructions.append(instruction)
+
+        labels = entry["labels"]
+        if not all(type(name) is str and type(position) is int and 0 <= position < len(instructions)
+                   for name, position in labels.items()):
+            raise ValueError("invalid labels")
+        return instructions, labels
+
+    def decode_argument(self, argType, arg):
+        """Convert stored operand to its loaded form."""
+        if argType == "var":
+            if type(arg) is not list or len(arg) != 2 or not all(type(part) is str for part in arg):
+                raise ValueError("invalid variable")
+            return arg
+        elif argType in ["label", "type"]:
+            if arg is not None and type(arg) is not str:
+                raise ValueError("invalid operand")
+            return arg
+        elif argType == "nil":
+            return NIL_CONST
+        elif argType == "bool" and type(arg) is bool:
+            return TRUE if arg else FALSE
+        elif argType in self.CONST_TYPES and type(arg) is self.VALUE_TYPES[self.CONST_TYPES[argType]]:
+            return Const(self.CONST_TYPES[argType], arg)
+        raise ValueError("invalid constant")
@@ -0,0 +1,281 @@
+##
+#   @file compiler.py
+#
+#   @brief Compilation of basic blocks to Python functions
+#   @author Patrik Sehnoutek, xsehno01
+#
+
+from .components import *
+from .error import ErrorMessages
+
+
+class BlockCompiler:
+    """Compiler of basic blocks to generated Python source.
+
+    Every basic block becomes one function, which executes
+    instructions of the block and returns position of the next
+    instruction. Constants are inlined, objects used by the block
+    (GF variables, resolved operands, helpers) are bound to local
+    names through default arguments. Instructions without translation
+    call their bound handlers, so the result of the function is
+    always the same as of the interpretation.
+    """
+    # opcodes which do not continue with the next instruction
+    NO_FALLTHROUGH = ["JUMP", "RETURN", "EXIT"]
+    # opcodes which change instruction counter
+    JUMPS = ["JUMP", "CALL", "RETURN", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS",
+             "LT_JUMP", "GT_JUMP", "EQ_JUMP"]
+    # opcode -> Python operator
+    OPERATORS = {"ADD" : "+", "SUB" : "-", "MUL" : "*", "IDIV" : "//",
+                 "LT" : "<", "GT" : ">", "EQ" : "==", "AND" : "and", "OR" : "or",
+                 "LT_JUMP" : "<", "GT_JUMP" : ">", "EQ_JUMP" : "=="}
+    # opcode -> operator of Interpret.relation()
+    RELATIONS = {"LT" : "<", "GT" : ">", "EQ" : "=", "LT_JUMP" : "<", "GT_JUMP" : ">", "EQ_JUMP" : "="}
+
+    def __init__(self, interpret):
+        self.interpret = interpret
+        self.instructions = interpret.instructionsArray
+        # GF variables which may hold StringBuffer
+        self.buffered = {id(instruction.args[0].var) for instruction in self.instructions
+                         if instruction.opcode in ["CONCAT", "SETCHAR"] and instruction.args[0].frame == GF}
+        # objects available to generated code
+        self.namespace = {"interp" : interpret, "fail" : ErrorMessages.exit_code, "NIL" : NIL,
+                          "StringBuffer" : StringBuffer,
+                          "check_var" : interpret.check_var, "relation" : interpret.relation,
+                          "equal_symbols" : interpret.equal_symbols, "to_string" : interpret.to_string}
+        # id of object -> its name in namespace
+        self.names = {}
+        # state of currently generated block
+        self.lines = []
+        self.used = set()
+        self.temps = 0
+
+    def compile(self):
+        """Compile all basic blocks.
+
+            :return: list of block functions indexed by position of their
+                     first instruction (None elsewhere) | None if compilation fails
+        """
+        count = len(self.instructions)
+        leaders = {0}
+        for position, instruction in enumerate(self.instructions):
+            if instruction.opcode in self.JUMPS:
+                leaders.add(instruction.target + 1)
+            if instruction.opcode in self.JUMPS or instruction.opcode in self.NO_FALLTHROUGH:
+                leaders.add(position + 1)
+        leaders = sorted(leader for leader in leaders if leader < count)
+
+        source = []
+        for start, end in zip(leaders, leaders[1:] + [count]):
+            source.extend(self.compile_block(start, end))
+
+        try:
+            exec(compile("\n".join(source), "<blocks>", "exec"), self.namespace)
+        except (SyntaxError, RecursionError, MemoryError):
+            return None
+
+        blocks = [None] * count
+        for leader in leaders:
+            blocks[leader] = self.namespace["block_%d" % leader]
+        return blocks
+
+    def compile_block(self, start, end):
+        """Generate source of function for block of instructions."""
+        self.lines = []
+        self.used = set()
+        self.temps = 0
+
+        returns = False
+        for position in range(start, end):
+            instruction = self.instructions[position]
+            if not self.translate(instruction):
+                self.fallback(position, instruction)
+            returns = instruction.opcode in self.NO_FALLTHROUGH
+
+        if not returns:
+            self.emit("return %d" % end)
+
+        defaults = ", ".join("%s=%s" % (name, name) for name in sorted(self.used))
+        return ["def block_%d(%s):" % (start, defaults)] + ["    " + line for line in self.lines]
+
+    def emit(self, line):
+        self.lines.append(line)
+
+    def bind(self, obj, prefix):
+        """Get name of object in namespace of generated code."""
+        name = self.names.get(id(obj))
+        if name is None:
+            name = "%s%d" % (prefix, len(self.names))
+            self.names[id(obj)] = name
+            self.namespace[name] = obj
+        self.used.add(name)
+        return name
+
+    def helper(self, name):
+        """Get name of helper from namespace."""
+        self.used.add(name)
+        return name
+
+    def temp(self):
+        self.temps += 1
+        return "t%d" % self.temps
+
+    def fallback(self, position, instruction):
+        """Execute instruction by its handler."""
+        self.emit("interp.instructionCounter = %d" % position)
+        self.used.add("interp")
+        self.emit("%s()" % self.bind(instruction.handler, "h"))
+        if instruction.opcode in self.JUMPS:
+            self.emit("return interp.instructionCounter + 1")
+
+    def literal(self, const):
+        """Python expression with value of constant."""
+        if const.type == NIL_TYPE:
+            return self.helper("NIL")
+        return repr(const.value)
+
+    def dest(self, operand):
+        """Generate check of destination variable.
+
+            :return: expression with variable
+        """
+        if operand.frame == GF:
+            var = self.bind(operand.var, "g")
+            self.emit("if not %s.defined: %s(54)" % (var, self.helper("fail")))
+            return var
+
+        var = self.temp()
+        self.emit("%s = %s(%s)" % (var, self.helper("check_var"), self.bind(operand, "r")))
+        return var
+
+    def symb(self, operand, type=None):
+        """Generate read of operand <symb> with optional type check.
+
+            :return: (expression with value, expression with object having
+                     attributes 'type' and 'value', type if known at compilation)
+        """
+        if operand.__class__ is Const:
+            if type is not None and operand.type != type:
+                self.emit("%s(53)" % self.helper("fail"))
+            return self.literal(operand), self.bind(operand, "c"), operand.type
+
+        if operand.__class__ is Variable:
+            # operand with type proven by optimizer
+            var = self.bind(operand, "g")
+            return var + ".value", var, type
+
+        if operand.frame == GF:
+            var = self.bind(operand.var, "g")
+            self.emit("if not %s.defined: %s(54)" % (var, self.helper("fail")))
+            self.emit("if %s.value is None: %s(56)" % (var, self.helper("fail")))
+            if id(operand.var) in self.buffered:
+                self.emit("if %s.value.__class__ is %s: %s.value = str(%s.value)" % (var, self.helper("StringBuffer"), var, var))
+        else:
+            var = self.temp()
+            self.emit("%s = %s(%s, True)" % (var, self.helper("check_var"), self.bind(operand, "r")))
+
+        if type is not None:
+            self.emit("if %s.type != %d: %s(53)" % (var, type, self.helper("fail")))
+        return var + ".value", var, type
+
+    def same_var(self, operand1, operand2):
+        """Check if operands refer to the same variable."""
+        return (isinstance(operand1, VarRef) and isinstance(operand2, VarRef)
+                and operand1.frame == operand2.frame and operand1.name == operand2.name)
+
+    def may_be_buffer(self, operand):
+        """Check if operand <symb> may hold StringBuffer."""
+        if not isinstance(operand, VarRef):
+            return False
+        return operand.frame != GF or id(operand.var) in self.buffered
+
+    def assign(self, dest, value, type):
+        self.emit("%s.value = %s" % (dest, value))
+        self.emit("%s.type = %s" % (dest, type))
+
+    def translate(self, instruction):
+        """Generate code of instruction.
+
+            :return: False if instruction has no translation
+        """
+        opcode, args = instruction.opcode, instruction.args
+
+        if opcode == "LABEL":
+            return True
+        elif opcode == "JUMP":
+            self.emit("return %d" % (instruction.target + 1))
+        elif opcode == "MOVE":
+            dest = self.dest(args[0])
+            value, symb, type = self.symb(args[1])
+            self.assign(dest, value, type if type is not None else symb + ".type")
+        elif opcode in ["ADD", "SUB", "MUL", "IDIV"]:
+            dest = self.dest(args[0])
+            value1 = self.symb(args[1], INT)[0]
+            value2 = self.symb(args[2], INT)[0]
+            if opcode == "IDIV":
+                self.emit("if %s == 0: %s(57)" % (value2, self.helper("fail")))
+            self.assign(dest, "%s %s %s" % (value1, self.OPERATORS[opcode], value2), INT)
+        elif opcode in ["AND", "OR"]:
+            dest = self.dest(args[0])
+            value1 = self.symb(args[1], BOOL)[0]
+            value2 = self.symb(args[2], BOOL)[0]
+            self.assign(dest, "%s %s %s" % (value1, self.OPERATORS[opcode], value2), BOOL)
+        elif opcode == "NOT":
+            dest = self.dest(args[0])
+            self.assign(dest, "not %s" % self.symb(args[1], BOOL)[0], BOOL)
+        elif opcode == "CONCAT":
+            if self.same_var(args[0], args[1]):
+                # appending to the destination may use StringBuffer
+                return False
+            dest = self.dest(args[0])
+            value1 = self.symb(args[1], STRING)[0]
+            value2 = self.symb(args[2], STRING)[0]
+            self.assign(dest, "%s + %s" % (value1, value2), STRING)
+        elif opcode == "STRLEN":
+            if self.may_be_buffer(args[1]):
+                # length of StringBuffer is read without conversion to str
+                return False
+            dest = self.dest(args[0])
+            self.assign(dest, "len(%s)" % self.symb(args[1], STRING)[0], INT)
+        elif opcode in self.RELATIONS:
+            dest = self.dest(args[0])
+            result = self.relation(instruction)
+            self.assign(dest, result, BOOL)
+            if opcode in ["LT_JUMP", "GT_JUMP", "EQ_JUMP"]:
+                self.emit("if %s == %r: return %d" % (result, args[3], instruction.target + 1))
+        elif opcode in ["JUMPIFEQ", "JUMPIFNEQ"]:
+            value1, symb1, type1 = self.symb(args[1])
+            value2, symb2, type2 = self.symb(args[2])
+            if instruction.typed:
+                equal = "%s == %s" % (value1, value2)
+            else:
+                equal = "%s(%s, %s)" % (self.helper("equal_symbols"), symb1, symb2)
+            self.emit("if (%s) == %r: return %d" % (equal, opcode == "JUMPIFEQ", instruction.target + 1))
+        elif opcode == "WRITE":
+            value, symb, type = self.symb(args[0])
+            if type == STRING:
+                self.emit("interp.stdout.write(%s)" % value)
+            elif type is None:
+                self.emit("if %s.type != %d: interp.stdout.write(%s(%s))" % (symb, NIL_TYPE, self.helper("to_string"), value))
+            elif type != NIL_TYPE:
+                self.emit("interp.stdout.write(%s(%s))" % (self.helper("to_string"), value))
+            self.used.add("interp")
+        else:
+            return False
+        return True
+
+    def relation(self, instruction):
+        """Generate comparison of two operands <symb>.
+
+            :return: name of variable with result
+        """
+        value1, symb1, type1 = self.symb(instruction.args[1])
+        value2, symb2, type2 = self.symb(instruction.args[2])
+        result = self.temp()
+
+        # types are known to be valid for the operator
+        if instruction.typed:
+            self.emit("%s = %s %s %s" % (result, value1, self.OPERATORS[instruction.opcode], value2))
+        else:
+            self.emit("%s = %s(%r, %s, %s)" % (result, self.helper("relation"), self.RELATIONS[instruction.opcode], symb1, symb2))
+        return result
@@ -5,26 +5,110 @@
 #   @author Patrik Sehnoutek, xsehno01
 #
 
+from collections import namedtuple
+
 from .error import ErrorMessages
 
 
+class Nil:
+    """Type of value nil."""
+    def __repr__(self):
+        return "nil"
+
+
+# the only value of type nil
+NIL = Nil()
+
+# immutable literal operand with value decoded to native type
+Const = namedtuple("Const", ["type", "value"])
+
+# type tags of values
+INT, BOOL, STRING, NIL_TYPE = 1, 2, 3, 4
+
+TYPE_NAMES = {INT : "int", BOOL : "bool", STRING : "string", NIL_TYPE : "nil"}
+
+# shared constants
+NIL_CONST = Const(NIL_TYPE, NIL)
+TRUE = Const(BOOL, True)
+FALSE = Const(BOOL, False)
+
+# frames of variable references
+GF, LF, TF = 0, 1, 2
+
+
+class StringBuffer:
+    """Mutable string value of variable.
+    
+    Characters are kept in list, so appending is amortized O(1)
+    per character and characters are replaced in place. Variable
+    holds the buffer only between its modifications, reading its
+    value converts the buffer back to str.
+    """
+    __slots__ = ("chars",)
+    # strings shorter than this are modified by slicing and concatenation
+    THRESHOLD = 1024
+
+    def __init__(self, string):
+        self.chars = list(string)
+
+    def append(self, string):
+        self.chars.extend(string)
+
+    def __setitem__(self, pos, char):
+        self.chars[pos] = char
+
+    def __getitem__(self, pos):
+        return self.chars[pos]
+
+    def __len__(self):
+        return len(self.chars)
+
+    def __str__(self):
+        return "".join(self.chars)
+
+    def __repr__(self):
+        return repr(str(self))
+
+
 class Variable:
-    """Class for variable."""
+    """Class for variable.
+    
+    Value is stored as native Python value (int, bool, str or NIL),
+    type is one of type tags. Uninitialized variable has both None.
+    String value may be also StringBuffer while the string is being
+    built by CONCAT or modified by SETCHAR.
+    """
+    __slots__ = ("name", "value", "type", "frame", "defined")
+
     def __init__(self, name, frame):
         self.name = name
         self.value = None
         self.type = None
         self.frame = frame
+        # GF variables exist before their DEFVAR
+        self.defined = True
 
     def change_value(self, value, type):
         """Update value and type of variable."""
-        if type == "int":
-            value = int(value)        
-        
         self.value = value
         self.type = type
 
 
+class VarRef:
+    """Variable operand resolved to its place in frames.
+    
+    GF references point directly to the variable, LF and TF
+    references contain a slot offset in the frame. Variables with
+    different names may share the offset, the variable is then
+    placed at the end of the frame.
+    """
+    def __init__(self, name, frame, slot=-1, var=None):
+        self.name = name
+        self.frame = frame
+        self.slot = slot
+        self.var = var
+
+
 class Instruction:
     """Class for parsed instruction with arguments."""
     def __init__(self):
@@ -33,6 +117,16 @@ class Instruction:
         self.args = []
         self.types = []
         self.no_args = 0
+        # position of label for jumps
+        self.target = -1
+        # instructions replaced by superinstruction
+        self.parts = None
+        # operand types proven by Optimizer.infer_types()
+        self.typed = False
+        # slots of TF defined right after CREATEFRAME
+        self.size = 0
+        # handler bound by Interpret.compile_instructions()
+        self.handler = None
 
 
 class Frames:
@@ -42,15 +136,26 @@ class Frames:
     and Global Frame (GF). TF is created using opcode CREATEFRAME.
     TF become LF after using opcode PUSHSFRAME. GF is available
     during whole execution.
+
+    Variables of discarded frames are kept and reused by DEFVAR,
+    so function calls allocate almost no new objects.
     """
     def __init__(self):
         self.framesStack = []
         self.globalFrame = {}
         self.tmpFrame = None
+        # variables of discarded frames
+        self.spareVars = []
+
+    def release_frame(self):
+        """Discard TF and keep its variables for reuse."""
+        if self.tmpFrame is not None:
+            self.spareVars.extend(filter(None, self.tmpFrame))
 
-    def create_frame(self):
-        """Create new TF."""
-        self.tmpFrame = {}
+    def create_frame(self, size=0):
+        """Create new TF with given number of slots."""
+        self.release_frame()
+        self.tmpFrame = [None] * size
 
     def push_frame(self):
         """Save TF to frame stack."""
@@ -65,39 +170,91 @@ class Frames:
         if not self.framesStack:
             ErrorMessages.exit_code(55)
 
+        self.release_frame()
         self.tmpFrame = self.framesStack.pop()
 
-    def find_var(self, varName, frame) -> Variable:
-        """Find variable by its name in the given frame.
+    def global_var(self, varName) -> Variable:
+        """Get GF variable for binding, create it undefined if needed."""
+        if varName not in self.globalFrame:
+            variable = Variable(varName, "GF")
+            variable.defined = False
+            self.globalFrame[varName] = variable
+        return self.globalFrame[varName]
+
+    def local_frame(self, ref : VarRef) -> list:
+        """Get LF or TF according to the reference."""
+        if ref.frame == LF:
+            if not self.framesStack:
+                ErrorMessages.exit_code(55)
+            return self.framesStack[-1]
+        
+        if self.tmpFrame is None:
+            ErrorMessages.exit_code(55)
+        return self.tmpFrame
+
+    def find_var(self, ref : VarRef) -> Variable:
+        """Find referenced variable in its frame.
         
             :return: found variable | None
             :rtype: instance of class Variable | None
         """
-        if frame == "GF":
-            if varName in self.globalFrame:
-                return self.globalFrame[varName]
-        elif frame == "LF": 
-            if not self.framesStack:
-                ErrorMessages.exit_code(55)
-            if varName in self.framesStack[-1]:
-                return self.framesStack[-1][varName]
-        elif frame == "TF":
-            if self.tmpFrame == None:
-                ErrorMessages.exit_code(55)
-            if varName in self.tmpFrame: 
-                return self.tmpFrame[varName]
+        if ref.frame == GF:
+            if ref.var.defined:
+                return ref.var
+            return None
+
+        frame = self.local_frame(ref)
+        if ref.slot < len(frame):
+            var = frame[ref.slot]
+            if var is None or var.name == ref.name:
+                return var
+            # slot is taken by other variable, the referenced one
+            # can be only at other position
+            return self.search_frame(frame, ref.name)
 
         return None
 
-    def add_var(self, varName, frame):
-        """Save variable to the given frame."""
-        if self.find_var(varName, frame):
-            ErrorMessages.exit_code(52)
+    def search_frame(self, frame, name):
+        """Find variable placed outside of its slot."""
+        for var in frame:
+            if var is not None and var.name == name:
+                return var
+        return None
 
-        variable = Variable(varName, frame)
-        if frame == "GF":
-            self.globalFrame[varName] = variable
-        elif frame == "LF":
-            self.framesStack[-1][varName] = variable
-        elif frame == "TF":
-            self.tmpFrame[varName] = variable
+    def add_var(self, ref : VarRef) -> Variable:
+        """Save variable to the frame given by reference and return it."""
+        if ref.frame == GF:
+            if ref.var.defined:
+                ErrorMessages.exit_code(52)
+            ref.var.defined = True
+            return ref.var
+
+        frame = self.local_frame(ref)
+        slot = ref.slot
+        if slot >= len(frame):
+            frame.extend([None] * (slot + 1 - len(frame)))
+        elif frame[slot] is not None:
+            if frame[slot].name == ref.name or self.search_frame(frame, ref.name):
+                ErrorMessages.exit_code(52)
+            slot = len(frame)
+            frame.append(None)
+
+        frameName = "LF" if ref.frame == LF else "TF"
+        if self.spareVars:
+            var = self.spareVars.pop()
+            var.name, var.frame = ref.name, frameName
+            var.change_value(None, None)
+        else:
+            var = Variable(ref.name, frameName)
+        frame[slot] = var
+        return var
+
+    def dump_frame(self, frame):
+        """Convert LF or TF to dictionary of variable values."""
+        if frame is None:
+            return None
+        return {var.name : var.value for var in frame if var}
+
+    def dump_global_frame(self):
+        """Convert GF to dictionary of variable values."""
+        return {name : var.value for name, var in self.globalFrame.items() if var.defined}
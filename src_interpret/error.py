@@ -9,6 +9,26 @@ import sys
 
 class ErrorMessages:
     """Exit program with given code and print error message."""
+
+    # functions called before every exit of the program
+    exit_hooks = []
+
+    @staticmethod
+    def add_exit_hook(hook):
+        """Register function called before the program exits."""
+        ErrorMessages.exit_hooks.append(hook)
+
+    @staticmethod
+    def run_exit_hooks():
+        """Call and unregister all exit hooks."""
+        while ErrorMessages.exit_hooks:
+            ErrorMessages.exit_hooks.pop(0)()
+
+    @staticmethod
+    def exit_program(code):
+        """Exit program with given code without error message."""
+        ErrorMessages.run_exit_hooks()
+        exit(code)
     
     @staticmethod
     def exit_code(err_code):
@@ -16,6 +36,10 @@ class ErrorMessages:
         ERRORS = {
         10 : "ERROR: Wrong program argument or unknown combination of arguments!",
         11 : "ERROR: Cannot open file for reading!",
+        12 : "ERROR: Cannot open file for writing!",
+        21 : "ERROR: Missing or wrong header!",
+        22 : "ERROR: Unknown opcode!",
+        23 : "ERROR: Lexical or syntax!",
         31 : "ERORR: Invalid XML format of input file",
         32 : "ERROR: Unexpected XML structure",
         52 : "SEMATIC ERROR: ...",
@@ -27,5 +51,6 @@ class ErrorMessages:
         58 : "RUNTIME ERROR: Invalid string operation"
         }
 
+        ErrorMessages.run_exit_hooks()
         print(ERRORS[err_code], file=sys.stderr)
         exit(err_code)
\ No newline at end of file
@@ -0,0 +1,454 @@
+##
+#   @file optimizer.py
+#
+#   @brief Optimization passes over loaded instructions
+#   @author Patrik Sehnoutek, xsehno01
+#
+
+from .components import *
+
+
+class Optimizer:
+    """Optimizer of instruction array with resolved operands.
+    
+    Every pass keeps observable behavior of the program including
+    error codes. Jump targets are remapped whenever instructions
+    are removed or fused.
+    """
+    # opcodes of superinstruction fused from comparison and conditional jump
+    COMPARE_JUMPS = {"LT" : "LT_JUMP", "GT" : "GT_JUMP", "EQ" : "EQ_JUMP"}
+    # opcodes writing to variable in the first operand
+    WRITES = ["MOVE", "DEFVAR", "POPS", "TYPE", "STRLEN", "INT2CHAR", "READ", "AND", "OR", "NOT",
+              "LT", "GT", "EQ", "IDIV", "MUL", "SUB", "ADD", "STRI2INT", "CONCAT", "GETCHAR", "SETCHAR"]
+    # opcodes which do not continue with the next instruction
+    NO_FALLTHROUGH = ["JUMP", "RETURN", "EXIT"]
+    # opcodes with jump target
+    JUMPS = ["JUMP", "CALL", "JUMPIFEQ", "JUMPIFNEQ", "JUMPIFEQS", "JUMPIFNEQS"]
+
+    # inferred types of variables, UNINIT stands for uninitialized variable
+    UNINIT = 0
+    ANY_VALUE = frozenset([INT, BOOL, STRING, NIL_TYPE])
+    # opcode -> types of its result
+    RESULT_TYPES = {"ADD" : {INT}, "SUB" : {INT}, "MUL" : {INT}, "IDIV" : {INT},
+                    "STRLEN" : {INT}, "STRI2INT" : {INT},
+                    "LT" : {BOOL}, "GT" : {BOOL}, "EQ" : {BOOL},
+                    "AND" : {BOOL}, "OR" : {BOOL}, "NOT" : {BOOL},
+                    "LT_JUMP" : {BOOL}, "GT_JUMP" : {BOOL}, "EQ_JUMP" : {BOOL},
+                    "CONCAT" : {STRING}, "GETCHAR" : {STRING}, "SETCHAR" : {STRING},
+                    "INT2CHAR" : {STRING}, "TYPE" : {STRING},
+                    "DEFVAR" : {UNINIT}, "POPS" : ANY_VALUE}
+    # types of operands which cannot fail type check
+    # opcode -> allowed types of operands from the second one
+    CHECKED_TYPES = {"ADD" : [INT, INT], "SUB" : [INT, INT], "MUL" : [INT, INT], "IDIV" : [INT, INT],
+                     "AND" : [BOOL, BOOL], "OR" : [BOOL, BOOL], "NOT" : [BOOL],
+                     "CONCAT" : [STRING, STRING], "STRLEN" : [STRING],
+                     "GETCHAR" : [STRING, INT], "STRI2INT" : [STRING, INT]}
+    # opcodes comparing two operands of the same type
+    COMPARISONS = ["LT", "GT", "EQ", "LT_JUMP", "GT_JUMP", "EQ_JUMP", "JUMPIFEQ", "JUMPIFNEQ"]
+    TYPE_TAGS = {name : tag for tag, name in TYPE_NAMES.items()}
+
+    def __init__(self, instructions, operations):
+        self.instructions = instructions
+        # interpret providing operations with values
+        self.operations = operations
+
+    def optimize(self) -> list:
+        """Run all passes and return optimized instruction array."""
+        self.fold_constants()
+        self.remove_dead_code()
+        self.fuse_instructions()
+        self.remove_labels()
+        self.infer_types()
+        return self.instructions
+
+    def block_leaders(self):
+        """Find positions where basic blocks start."""
+        leaders = {0}
+        for position, instruction in enumerate(self.instructions):
+            if instruction.opcode == "LABEL" or instruction.target >= 0:
+                leaders.add(position + 1)
+            if instruction.opcode == "LABEL" or instruction.opcode in self.NO_FALLTHROUGH:
+                leaders.add(position)
+        return leaders
+
+    def fold_constants(self):
+        """Fold instructions with constant operands.
+        
+        Values of GF variables assigned by constants are propagated
+        to following instructions of the same basic block. Expressions
+        which would fail at runtime are kept unchanged.
+        """
+        leaders = self.block_leaders()
+        # GF variable -> its constant value
+        known = {}
+
+        for position, instruction in enumerate(self.instructions):
+            if position in leaders:
+                known.clear()
+
+            writes = instruction.opcode in self.WRITES
+            # replace read GF variables by their values,
+            # DPRINT prints nil variable differently from nil literal
+            for i in range(1 if writes else 0, instruction.no_args if instruction.opcode != "DPRINT" else 0):
+                operand = instruction.args[i]
+                if isinstance(operand, VarRef) and operand.frame == GF and operand.var in known:
+                    instruction.args[i] = known[operand.var]
+                    instruction.types[i] = TYPE_NAMES[known[operand.var].type]
+
+            if instruction.opcode in ["JUMPIFEQ", "JUMPIFNEQ"]:
+                self.fold_jump(instruction)
+                continue
+
+            value = self.fold(instruction)
+            if value is not None:
+                instruction.opcode = "MOVE"
+                instruction.args = [instruction.args[0], value]
+                instruction.types = ["var", TYPE_NAMES[value.type]]
+                instruction.no_args = 2
+            
+            if writes and instruction.args[0].frame == GF:
+                if instruction.opcode == "MOVE" and instruction.args[1].__class__ is Const:
+                    known[instruction.args[0].var] = instruction.args[1]
+                else:
+                    known.pop(instruction.args[0].var, None)
+            elif instruction.opcode == "CALL":
+                # called function can change any variable
+                known.clear()
+
+    def fold(self, instruction):
+        """Compute result of instruction with constant operands.
+        
+            :return: result | None if it cannot be computed at load time
+            :rtype: Const | None
+        """
+        opcode = instruction.opcode
+        symbols = instruction.args[1:]
+        if (opcode not in self.WRITES or opcode in ["MOVE", "DEFVAR", "POPS", "READ", "SETCHAR"]
+                or any(symb.__class__ is not Const for symb in symbols)):
+            return None
+        
+        operations = self.operations
+        types = [symb.type for symb in symbols]
+        values = [symb.value for symb in symbols]
+
+        if opcode in ["ADD", "SUB", "MUL", "IDIV"]:
+            if types != [INT, INT] or (opcode == "IDIV" and values[1] == 0):
+                return None
+            operator = operations.DISPATCH[opcode][1]
+            return Const(INT, operations.calculate(operator, *values))
+        elif opcode in ["LT", "GT", "EQ"]:
+            if types[0] != types[1] or types[0] == NIL_TYPE:
+                if opcode != "EQ" or NIL_TYPE not in types:
+                    return None
+            operator = operations.DISPATCH[opcode][1]
+            return TRUE if operations.relation(operator, *symbols) else FALSE
+        elif opcode in ["AND", "OR", "NOT"]:
+            if any(type != BOOL for type in types):
+                return None
+            operator = operations.DISPATCH[opcode][1]
+            return TRUE if operations.logical(operator, values[0], values[-1]) else FALSE
+        elif opcode == "CONCAT":
+            if types != [STRING, STRING]:
+                return None
+            return Const(STRING, values[0] + values[1])
+        elif opcode == "STRLEN":
+            if types != [STRING]:
+                return None
+            return Const(INT, len(values[0]))
+        elif opcode == "INT2CHAR":
+            if types != [INT] or not 0 <= values[0] <= 0x10FFFF:
+                return None
+            return Const(STRING, chr(values[0]))
+        elif opcode in ["STRI2INT", "GETCHAR"]:
+            if types != [STRING, INT] or not 0 <= values[1] < len(values[0]):
+                return None
+            char = values[0][values[1]]
+            return Const(INT, ord(char)) if opcode == "STRI2INT" else Const(STRING, char)
+        elif opcode == "TYPE":
+            return Const(STRING, TYPE_NAMES[types[0]])
+
+        return None
+
+    def fold_jump(self, instruction):
+        """Decide conditional jump with constant operands."""
+        symb1, symb2 = instruction.args[1], instruction.args[2]
+        if symb1.__class__ is not Const or symb2.__class__ is not Const:
+            return
+        if symb1.type != symb2.type and NIL_TYPE not in [symb1.type, symb2.type]:
+            return
+
+        if (symb1.value == symb2.value) == (instruction.opcode == "JUMPIFEQ"):
+            instruction.opcode = "JUMP"
+        else:
+            # jump is never taken, LABEL does nothing
+            instruction.opcode = "LABEL"
+            instruction.target = -1
+        instruction.args = instruction.args[:1]
+        instruction.types = ["label"]
+        instruction.no_args = 1
+
+    def remove_dead_code(self):
+        """Remove instructions unreachable by jumps or fall-through.
+        
+        Instructions after CALL are considered reachable, because
+        the called function may return there.
+        """
+        reachable = [False] * len(self.instructions)
+        pending = [0] if self.instructions else []
+
+        while pending:
+            position = pending.pop()
+            if position >= len(self.instructions) or reachable[position]:
+                continue
+            reachable[position] = True
+            
+            instruction = self.instructions[position]
+            if instruction.opcode in self.JUMPS:
+                pending.append(instruction.target + 1)
+            if instruction.opcode not in self.NO_FALLTHROUGH:
+                pending.append(position + 1)
+
+        self.remove_instructions(reachable)
+
+    def same_var(self, operand1, operand2):
+        """Check if operands refer to the same variable."""
+        return (isinstance(operand1, VarRef) and isinstance(operand2, VarRef)
+                and operand1.frame == operand2.frame and operand1.name == operand2.name)
+
+    def superinstruction(self, opcode, parts, args, types):
+        """Create instruction replacing given sequence of instructions."""
+        instruction = Instruction()
+        instruction.opcode = opcode
+        instruction.order = parts[0].order
+        instruction.args = args
+        instruction.types = types
+        instruction.no_args = len(args)
+        instruction.target = parts[-1].target
+        instruction.parts = parts
+        return instruction
+
+    def fuse_pair(self, first, second):
+        """Fuse two consecutive instructions.
+        
+            :return: superinstruction | None if they cannot be fused
+        """
+        # DEFVAR x + MOVE x <symb>
+        if first.opcode == "DEFVAR" and second.opcode == "MOVE" and self.same_var(first.args[0], second.args[0]):
+            return self.superinstruction("DEFVAR_MOVE", [first, second], second.args[:], second.types[:])
+
+        # PUSHS <symb> + POPS x
+        if first.opcode == "PUSHS" and second.opcode == "POPS":
+            return self.superinstruction("PUSHS_POPS", [first, second], [second.args[0], first.args[0]], ["var", first.types[0]])
+
+        # EQ|LT|GT x <symb> <symb> + JUMPIFEQ|JUMPIFNEQ <label> x bool@true|false
+        if first.opcode in self.COMPARE_JUMPS and second.opcode in ["JUMPIFEQ", "JUMPIFNEQ"]:
+            dest = first.args[0]
+            for var, const in [(second.args[1], second.args[2]), (second.args[2], second.args[1])]:
+                if self.same_var(dest, var) and const.__class__ is Const and const.type == BOOL:
+                    # jump when result of comparison equals this value
+                    expected = const.value if second.opcode == "JUMPIFEQ" else not const.value
+                    return self.superinstruction(self.COMPARE_JUMPS[first.opcode], [first, second],
+                                                 first.args + [expected], first.types + ["bool"])
+
+        return None
+
+    def fuse_instructions(self):
+        """Replace common sequences of instructions by superinstructions."""
+        fused = []
+        # old position -> new position
+        positions = []
+
+        i = 0
+        while i < len(self.instructions):
+            instruction = self.instructions[i]
+            superinstruction = None
+            if i + 1 < len(self.instructions):
+                superinstruction = self.fuse_pair(instruction, self.instructions[i+1])
+
+            positions.append(len(fused))
+            if superinstruction:
+                # nothing jumps between the parts, only to labels
+                positions.append(len(fused))
+                fused.append(superinstruction)
+                i += 2
+            else:
+                fused.append(instruction)
+                i += 1
+
+        self.remap_targets(fused, positions)
+        self.instructions = fused
+
+    def remove_labels(self):
+        """Remove labels from executed instructions."""
+        self.remove_instructions([instruction.opcode != "LABEL" for instruction in self.instructions])
+
+    def remove_instructions(self, keep):
+        """Keep only instructions marked in the given list."""
+        kept = []
+        positions = []
+        for instruction, keepInstruction in zip(self.instructions, keep):
+            positions.append(len(kept))
+            if keepInstruction:
+                kept.append(instruction)
+
+        self.remap_targets(kept, positions)
+        self.instructions = kept
+
+    def remap_targets(self, instructions, positions):
+        """Update jump targets after moving instructions.
+        
+        Jump sets instruction counter to its target and the
+        instruction after the target is executed next.
+        """
+        positions.append(len(instructions))
+        for instruction in instructions:
+            if instruction.target >= 0:
+                instruction.target = positions[instruction.target + 1] - 1
+
+    def jumps(self, instruction):
+        """Check if instruction may continue at its jump target."""
+        return instruction.opcode in self.JUMPS or instruction.opcode in self.COMPARE_JUMPS.values()
+
+    def operand_types(self, operand, state):
+        """Get possible types of operand <symb> in abstract state.
+        
+        Without state every variable can have any type.
+        """
+        if operand.__class__ is Const:
+            return {operand.type}
+        if operand.frame == GF and state is not None:
+            return state.get(operand.var, {self.UNINIT})
+        return self.ANY_VALUE | {self.UNINIT}
+
+    def result_types(self, instruction, state):
+        """Get possible types of value written by instruction.
+        
+            :return: types | None if instruction does not write to GF variable
+        """
+        opcode = instruction.opcode
+        if (instruction.no_args == 0 or not isinstance(instruction.args[0], VarRef)
+                or instruction.types[0] != "var" or instruction.args[0].frame != GF):
+            return None
+
+        if opcode in self.RESULT_TYPES:
+            return set(self.RESULT_TYPES[opcode])
+        elif opcode in ["MOVE", "DEFVAR_MOVE", "PUSHS_POPS"]:
+            # read of uninitialized variable fails
+            return self.operand_types(instruction.args[1], state) - {self.UNINIT}
+        elif opcode == "READ":
+            return {self.TYPE_TAGS.get(instruction.args[1], NIL_TYPE), NIL_TYPE}
+        return None
+
+    def transfer(self, instruction, state):
+        """Update abstract state by effect of instruction."""
+        types = self.result_types(instruction, state)
+        if types is not None:
+            state[instruction.args[0].var] = types
+
+    def join(self, states, position, state):
+        """Merge state to state at start of block.
+        
+            :return: True if state at start of block changed
+        """
+        if position not in states:
+            states[position] = dict(state)
+            return True
+
+        changed = False
+        old = states[position]
+        for var in set(old) | set(state):
+            types = old.get(var, {self.UNINIT}) | state.get(var, {self.UNINIT})
+            if types != old.get(var, {self.UNINIT}):
+                old[var] = types
+                changed = True
+        return changed
+
+    def proven(self, instruction, state):
+        """Check if types of operands of instruction cannot fail."""
+        opcode = instruction.opcode
+        if opcode not in self.CHECKED_TYPES and opcode not in self.COMPARISONS:
+            return False
+
+        # operands <symb> are always the second and the third one
+        operands = instruction.args[1:3]
+        if any(isinstance(operand, VarRef) and operand.var in self.buffered for operand in operands):
+            return False
+        types = [self.operand_types(operand, state) for operand in operands]
+        if any(len(symbTypes) != 1 or self.UNINIT in symbTypes for symbTypes in types):
+            return False
+        types = [next(iter(symbTypes)) for symbTypes in types]
+
+        if opcode in self.CHECKED_TYPES:
+            return types == self.CHECKED_TYPES[opcode]
+        elif opcode in self.COMPARISONS:
+            if opcode in ["LT", "GT", "LT_JUMP", "GT_JUMP"]:
+                return types[0] == types[1] and types[0] != NIL_TYPE
+            return types[0] == types[1] or NIL_TYPE in types
+        return False
+
+    def infer_types(self):
+        """Infer types of GF variables and mark instructions with proven types.
+        
+        Abstract interpretation over basic blocks computes possible types
+        of every GF variable. Called function may change GF variables,
+        so after CALL every variable can also have any type written
+        to it anywhere in the program. Marked instructions get handlers
+        without type checks and read their GF operands directly.
+        Variables modified by CONCAT or SETCHAR may hold StringBuffer
+        instead of str, instructions reading them keep type checks.
+        """
+        count = len(self.instructions)
+        self.buffered = {instruction.args[0].var for instruction in self.instructions
+                         if instruction.opcode in ["CONCAT", "SETCHAR"] and instruction.args[0].frame == GF}
+        
+        # types written to variables anywhere in the program
+        written = {}
+        for instruction in self.instructions:
+            types = self.result_types(instruction, None)
+            if types is not None:
+                written.setdefault(instruction.args[0].var, set()).update(types)
+
+        leaders = {0}
+        for position, instruction in enumerate(self.instructions):
+            if self.jumps(instruction):
+                leaders.add(instruction.target + 1)
+            if self.jumps(instruction) or instruction.opcode in self.NO_FALLTHROUGH:
+                leaders.add(position + 1)
+        leaders = sorted(leader for leader in leaders if leader < count)
+        blockEnds = dict(zip(leaders, leaders[1:] + [count]))
+
+        states = {}
+        if count:
+            states[0] = {}
+        pending = list(states)
+        while pending:
+            start = pending.pop()
+            state = dict(states[start])
+            for position in range(start, blockEnds[start]):
+                self.transfer(self.instructions[position], state)
+            
+            last = self.instructions[blockEnds[start] - 1]
+            successors = []
+            if self.jumps(last):
+                successors.append((last.target + 1, state))
+            if last.opcode == "CALL":
+                returned = dict(state)
+                for var, types in written.items():
+                    returned[var] = state.get(var, {self.UNINIT}) | types
+                successors.append((blockEnds[start], returned))
+            elif last.opcode not in self.NO_FALLTHROUGH:
+                successors.append((blockEnds[start], state))
+
+            for successor, successorState in successors:
+                if successor < count and self.join(states, successor, successorState):
+                    pending.append(successor)
+
+        for start, state in states.items():
+            state = dict(state)
+            for position in range(start, blockEnds[start]):
+                instruction = self.instructions[position]
+                if self.proven(instruction, state):
+                    instruction.typed = True
+                    instruction.args = [operand.var if isinstance(operand, VarRef) and operand.frame == GF and i > 0
+                                        else operand for i, operand in enumerate(instruction.args)]
+                self.transfer(instruction, state)
@@ -0,0 +1,161 @@
+##
+#   @file profiler.py
+#
+#   @brief Profiling of executed instructions
+#   @author Patrik Sehnoutek, xsehno01
+#
+
+import signal, sys
+from time import perf_counter
+
+from .error import ErrorMessages
+
+
+class Profiler:
+    """Profiler of executed instructions.
+
+    Counts and cumulative time are recorded per position
+    in instruction array and summed per opcode and per order
+    in the report. Time of a called label is measured from CALL
+    to the matching RETURN and includes nested calls, recursive
+    calls are counted in the time of the outermost one.
+    """
+    def __init__(self, output=None):
+        # file for report, None for stderr
+        self.output = output
+        self.stream = None
+        self.instructions = []
+        self.counts = []
+        self.times = []
+        # label -> [calls, cumulative time]
+        self.calls = {}
+        # (label, time of CALL) of unfinished calls
+        self.active = []
+        # label -> number of its unfinished calls
+        self.depths = {}
+        self.started = 0.0
+
+    def open(self):
+        """Open file for report."""
+        if self.output is None:
+            self.stream = sys.stderr
+            return
+        try:
+            self.stream = open(self.output, "w")
+        except OSError:
+            ErrorMessages.exit_code(12)
+
+    def start(self, instructions):
+        """Prepare counters for instruction array and register the report."""
+        self.instructions = instructions
+        self.counts = [0] * len(instructions)
+        self.times = [0.0] * len(instructions)
+        self.started = perf_counter()
+        ErrorMessages.add_exit_hook(self.report)
+
+    def enter(self, label, time):
+        """Record CALL of label."""
+        self.active.append((label, time))
+        self.depths[label] = self.depths.get(label, 0) + 1
+
+    def leave(self, time):
+        """Record RETURN from the last called label."""
+        if self.active:
+            label, start = self.active.pop()
+            self.depths[label] -= 1
+            stats = self.calls.setdefault(label, [0, 0.0])
+            stats[0] += 1
+            if not self.depths[label]:
+                stats[1] += time - start
+
+    def report(self):
+        """Write report sorted by cumulative time."""
+        now = perf_counter()
+        # calls unfinished at exit last until now
+        while self.active:
+            self.leave(now)
+
+        opcodes = {}
+        orders = {}
+        for instruction, count, time in zip(self.instructions, self.counts, self.times):
+            if not count:
+                continue
+            for stats, key in [(opcodes, instruction.opcode), (orders, (instruction.order, instruction.opcode))]:
+                entry = stats.setdefault(key, [0, 0.0])
+                entry[0] += count
+                entry[1] += time
+
+        lines = ["Profile: %d instructions in %.6f s" % (sum(self.counts), now - self.started), "",
+                 "%-16s %12s %12s" % ("Opcode", "Count", "Time [s]")]
+        for opcode, (count, time) in sorted(opcodes.items(), key=lambda item: -item[1][1]):
+            lines.append("%-16s %12d %12.6f" % (opcode, count, time))
+
+        lines += ["", "%-8s %-16s %12s %12s" % ("Order", "Opcode", "Count", "Time [s]")]
+        for (order, opcode), (count, time) in sorted(orders.items(), key=lambda item: -item[1][1]):
+            lines.append("%-8d %-16s %12d %12.6f" % (order, opcode, count, time))
+
+        lines += ["", "%-24s %12s %12s" % ("Label (CALL)", "Calls", "Time [s]")]
+        for label, (count, time) in sorted(self.calls.items(), key=lambda item: -item[1][1]):
+            lines.append("%-24s %12d %12.6f" % (label, count, time))
+
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+        if self.stream is not sys.stderr:
+            self.stream.close()
+
+
+class Sampler:
+    """Sampling profiler of IPPcode22 call stack.
+
+    Timer signal periodically records the stack of return positions.
+    The report maps every return position to the label of the CALL
+    before it and writes collapsed stacks accepted by flamegraph tools,
+    one line 'main;label;label count' per distinct stack.
+    """
+    # interval of sampling in seconds of CPU time
+    INTERVAL = 0.001
+
+    def __init__(self, output):
+        # sampling needs interval timer
+        if not hasattr(signal, "setitimer"):
+            ErrorMessages.exit_code(10)
+        self.output = output
+        self.stream = None
+        self.interpret = None
+        # tuple of return positions -> number of samples
+        self.samples = {}
+
+    def start(self, interpret):
+        """Open file for report and start sampling of call stack of interpret.
+
+        File is opened only after the program is loaded, so errors
+        of loading do not leave empty report.
+        """
+        try:
+            self.stream = open(self.output, "w")
+        except OSError:
+            ErrorMessages.exit_code(12)
+        self.interpret = interpret
+        ErrorMessages.add_exit_hook(self.report)
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.INTERVAL, self.INTERVAL)
+
+    def sample(self, signum, frame):
+        stack = tuple(self.interpret.callStack)
+        self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def report(self):
+        """Stop sampling and write collapsed stacks."""
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+        code = self.interpret.instructionsArray
+        stacks = {}
+        for positions, count in self.samples.items():
+            names = ["main"] + [code[position - 1].args[0] for position in positions]
+            stack = ";".join(names)
+            stacks[stack] = stacks.get(stack, 0) + count
+
+        for stack, count in sorted(stacks.items()):
+            self.stream.write("%s %d\n" % (stack, count))
+        self.stream.close()
@@ -0,0 +1,181 @@
+##
+#   @file source.py
+#
+#   @brief Parser of IPPcode22 source code
+#   @author Patrik Sehnoutek, xsehno01
+#
+
+import io, re
+
+from .error import ErrorMessages
+
+
+class SourceParser:
+    """Parser of IPPcode22 source code without XML.
+
+    Lexical and syntactic rules and error codes are the same
+    as in parse.php. Operands are produced as pairs of type and text,
+    which are the attribute 'type' and the text of argument elements
+    in XML generated by parse.php.
+    """
+    HEADER = ".IPPCODE22"
+    # opcode -> kinds of operands
+    OPCODES = {"CREATEFRAME" : [],
+               "PUSHFRAME" : [],
+               "POPFRAME" : [],
+               "RETURN" : [],
+               "BREAK" : [],
+               "CLEARS" : [],
+               "ADDS" : [],
+               "SUBS" : [],
+               "MULS" : [],
+               "IDIVS" : [],
+               "LTS" : [],
+               "GTS" : [],
+               "EQS" : [],
+               "ANDS" : [],
+               "ORS" : [],
+               "NOTS" : [],
+               "INT2CHARS" : [],
+               "STRI2INTS" : [],
+               "LABEL" : ["label"],
+               "JUMP" : ["label"],
+               "CALL" : ["label"],
+               "JUMPIFEQS" : ["label"],
+               "JUMPIFNEQS" : ["label"],
+               "EXIT" : ["symb"],
+               "DPRINT" : ["symb"],
+               "WRITE" : ["symb"],
+               "PUSHS" : ["symb"],
+               "DEFVAR" : ["var"],
+               "POPS" : ["var"],
+               "MOVE" : ["var", "symb"],
+               "TYPE" : ["var", "symb"],
+               "STRLEN" : ["var", "symb"],
+               "INT2CHAR" : ["var", "symb"],
+               "NOT" : ["var", "symb"],
+               "READ" : ["var", "type"],
+               "JUMPIFEQ" : ["label", "symb", "symb"],
+               "JUMPIFNEQ" : ["label", "symb", "symb"],
+               "AND" : ["var", "symb", "symb"],
+               "OR" : ["var", "symb", "symb"],
+               "LT" : ["var", "symb", "symb"],
+               "GT" : ["var", "symb", "symb"],
+               "EQ" : ["var", "symb", "symb"],
+               "IDIV" : ["var", "symb", "symb"],
+               "MUL" : ["var", "symb", "symb"],
+               "SUB" : ["var", "symb", "symb"],
+               "ADD" : ["var", "symb", "symb"],
+               "STRI2INT" : ["var", "symb", "symb"],
+               "CONCAT" : ["var", "symb", "symb"],
+               "GETCHAR" : ["var", "symb", "symb"],
+               "SETCHAR" : ["var", "symb", "symb"]
+            }
+
+    # whitespace of PCRE in parse.php
+    WHITESPACE = re.compile(r"[ \t\n\r\f\v]+")
+    LABEL = re.compile(r"[a-zA-Z_\-$&%*!?][0-9a-zA-Z_\-$&%*!?]*")
+    VAR = re.compile(r"(GF|LF|TF)@[a-zA-Z_\-$&%*!?][^ \t\n\r\f\v]*")
+    STRING = re.compile(r"([^\\ \t\n\r\f\v#]|\\[0-9]{3})*")
+    INT = re.compile(r"[-+][1-9][0-9]*|[1-9][0-9]*|0")
+    # strtoupper() of parse.php changes only ASCII letters
+    UPPER = str.maketrans("abcdefghijklmnopqrstuvwxyz", "ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+    def __init__(self, source):
+        """
+            :param source: file name | binary file object
+        """
+        self.source = source
+
+    def open(self):
+        """Open source code as text split only by line feeds.
+        
+        Bytes which are not UTF-8 are kept as surrogates, so they
+        are checked by the same rules as by parse.php.
+        """
+        if isinstance(self.source, str):
+            try:
+                return open(self.source, "r", encoding="utf-8", errors="surrogateescape", newline="\n")
+            except OSError:
+                ErrorMessages.exit_code(11)
+        return io.TextIOWrapper(self.source, encoding="utf-8", errors="surrogateescape", newline="\n")
+
+    def instructions(self):
+        """Parse source code.
+
+            :return: generator of opcodes and lists of operands (type, text)
+        """
+        header = False
+        # operands with bytes which are not UTF-8
+        invalid = False
+        with self.open() as lines:
+            for line in lines:
+                # fgets() loop of parse.php ends at line "0" without line feed
+                if line == "0":
+                    break
+                items = self.WHITESPACE.split(line.split("#", 1)[0])
+                items = [item for item in items if item]
+                if not items:
+                    continue
+
+                if not header:
+                    if len(items) != 1 or items[0].translate(self.UPPER) != self.HEADER:
+                        ErrorMessages.exit_code(21)
+                    header = True
+                    continue
+
+                # comments are not part of XML
+                if not line.isascii():
+                    invalid = invalid or not self.valid_text(" ".join(items))
+                yield self.parse_line(items)
+
+        if not header:
+            ErrorMessages.exit_code(21)
+        # parse.php accepts them, but its XML output is invalid
+        if invalid:
+            ErrorMessages.exit_code(31)
+
+    def valid_text(self, text):
+        """Check if text contains only valid UTF-8 characters."""
+        try:
+            text.encode("utf-8")
+        except UnicodeEncodeError:
+            return False
+        return True
+
+    def parse_line(self, items):
+        """Check opcode and operands of one instruction."""
+        opcode = items[0].translate(self.UPPER)
+        if opcode not in self.OPCODES:
+            ErrorMessages.exit_code(22)
+
+        kinds = self.OPCODES[opcode]
+        if len(items) != len(kinds) + 1:
+            ErrorMessages.exit_code(23)
+
+        return opcode, [self.parse_operand(kind, item) for kind, item in zip(kinds, items[1:])]
+
+    def parse_operand(self, kind, item):
+        """Check operand of given kind.
+
+            :return: type, text
+        """
+        if kind == "label":
+            if self.LABEL.fullmatch(item):
+                return "label", item
+        elif kind == "var" or (kind == "symb" and item[:2] in ["GF", "LF", "TF"]):
+            if self.VAR.fullmatch(item):
+                return "var", item
+        elif kind == "type":
+            if item in ["int", "string", "nil", "bool"]:
+                return "type", item
+        else:
+            type, separator, text = item.partition("@")
+            if separator and (
+                    (type == "nil" and text == "nil")
+                    or (type == "string" and self.STRING.fullmatch(text))
+                    or (type == "int" and self.INT.fullmatch(text))
+                    or (type == "bool" and text in ["true", "false"])):
+                return type, text
+
+        ErrorMessages.exit_code(23)
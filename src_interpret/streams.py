@@ -0,0 +1,90 @@
+##
+#   @file streams.py
+#
+#   @brief Input and output streams of interpreted program
+#   @author Patrik Sehnoutek, xsehno01
+#
+
+import sys
+
+from .error import ErrorMessages
+
+
+class InputReader:
+    """Reader of lines for opcode READ.
+    
+    The input is opened once on the first read and consumed lazily
+    line by line, the same way for STDIN and for a file.
+    """
+    # size of buffer for input file
+    BUFFER_SIZE = 1 << 16
+
+    def __init__(self, source):
+        self.source = source
+        self.stream = None
+
+    def open(self):
+        """Open input stream."""
+        if self.source == "STDIN":
+            self.stream = sys.stdin
+        else:
+            try:
+                self.stream = open(self.source, buffering=self.BUFFER_SIZE)
+            except:
+                ErrorMessages.exit_code(11)
+
+    def read_line(self):
+        """Read next line without trailing newline.
+        
+            :return: line | None at the end of input
+            :rtype: str | None
+        """
+        if self.stream is None:
+            self.open()
+
+        try:
+            line = self.stream.readline()
+        except:
+            ErrorMessages.exit_code(11)
+
+        if not line:
+            return None
+
+        if line[-1] == "\n":
+            line = line[:-1]
+        if line and line[-1] == "\r":
+            line = line[:-1]
+        return line
+
+
+class OutputBuffer:
+    """Buffer for output of WRITE and DPRINT.
+    
+    Written strings are collected and passed to the stream at once
+    when their length reaches the threshold. The buffer is flushed
+    before every exit of the program.
+    """
+    # default flush threshold in characters
+    THRESHOLD = 1 << 16
+
+    def __init__(self, stream, threshold=THRESHOLD):
+        self.stream = stream
+        self.threshold = threshold
+        self.chunks = []
+        self.size = 0
+        ErrorMessages.add_exit_hook(self.flush)
+
+    def write(self, string):
+        """Append string to the buffer."""
+        self.chunks.append(string)
+        self.size += len(string)
+        if self.size >= self.threshold:
+            self.flush()
+
+    def flush(self):
+        """Write content of the buffer to the stream."""
+        if self.chunks:
+            self.stream.write("".join(self.chunks))
+            self.chunks.clear()
+            self.size = 0
+        self.stream.flush()
@@ -11,15 +11,27 @@ declare(strict_types=1);
 
 class XMLFileWriter{
 
+    // number of instructions between flushes of the XML buffer
+    const FLUSH_INTERVAL = 1000;
+    // memory used by spool before it continues in a temporary file
+    const SPOOL_MEMORY = 4194304;
+
     private static $order;
     private static $xml;
+    // stream receiving flushed parts of the document
+    private static $output;
+    // document is copied to STDOUT only after it is complete
+    private static $spooled;
 
     /**
 	 * Constructor
+	 * @param bool $stream - write directly to STDOUT instead of spool
 	 */
-    public static function XMLFileWriter()
+    public static function XMLFileWriter($stream = false)
     {
         self::$order = 1;
+        self::$spooled = !$stream;
+        self::$output = $stream ? STDOUT : fopen("php://temp/maxmemory:".self::SPOOL_MEMORY, "w+");
         self::$xml = new XMLWriter();
         self::$xml->openMemory();
         self::$xml->startDocument('1.0', 'UTF-8');
@@ -35,6 +47,12 @@ class XMLFileWriter{
 	 */
     public static function addInstruction($opcode)
     {
+        // previous instruction is complete
+        if (self::$order % self::FLUSH_INTERVAL == 0)
+        {
+            self::flushBuffer();
+        }
+
         self::$xml->startElement('instruction');
         self::$xml->writeAttribute('order', strval(self::$order++));
         self::$xml->writeAttribute('opcode', strtoupper($opcode));
@@ -62,6 +80,14 @@ class XMLFileWriter{
         self::$xml->endElement();
     }
 
+    /**
+	 * Move generated part of the document to the output stream
+	 */
+    private static function flushBuffer()
+    {
+        fwrite(self::$output, self::$xml->flush());
+    }
+
     /**
 	 * Close program tag and end document
 	 */
@@ -70,7 +96,14 @@ class XMLFileWriter{
         self::$xml->endElement();
         
         self::$xml->endDocument();
-		fwrite(STDOUT, self::$xml->flush());
+        self::flushBuffer();
+
+        if (self::$spooled)
+        {
+            rewind(self::$output);
+            stream_copy_to_stream(self::$output, STDOUT);
+            fclose(self::$output);
+        }
     }
 }
 ?>
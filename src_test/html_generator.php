@@ -118,6 +118,11 @@ class HTMLgenerator
                 left: 5%
             }
 
+            .correct div.cached, .incorrect div.cached{
+                font-style: italic;
+                opacity: 0.7;
+            }
+
         </style>
     </head>';
 
@@ -153,10 +158,12 @@ class HTMLgenerator
      * 
      * @param passed Number of passed tests
      * @param all Number of all tests
+     * @param cached Number of tests with results of previous run
      */
-    public static function generateEndBody($passed, $all)
+    public static function generateEndBody($passed, $all, $cached = 0)
     {
-        self::$pageCode = self::$pageCode.'<div id="mainBody"><div id="numberOfCorrect"><h2>Correct: '.$passed.'/'.$all.'</h2><meter value="'.$passed.'" min="0" max="'.$all.'"></meter></div>'.self::$tests.self::$bodyEnd;
+        $cachedInfo = ($cached > 0) ? '<div>Cached results: '.$cached.'/'.$all.'</div>' : '';
+        self::$pageCode = self::$pageCode.'<div id="mainBody"><div id="numberOfCorrect"><h2>Correct: '.$passed.'/'.$all.'</h2><meter value="'.$passed.'" min="0" max="'.$all.'"></meter>'.$cachedInfo.'</div>'.self::$tests.self::$bodyEnd;
     }
 
     /**
@@ -174,16 +181,18 @@ class HTMLgenerator
      * 
      * @param fileName Name of a file
      * @param passed true/false
+     * @param cached true if result is from previous run
      */
-    public static function addTest($fileName, $passed)
+    public static function addTest($fileName, $passed, $cached = false)
     {
+        $test = $cached ? '<div class="cached">'.$fileName.' (cached)</div>' : '<div>'.$fileName.'</div>';
         if ($passed)
         {
-            self::$passedTests = self::$passedTests.'<div>'.$fileName.'</div>';
+            self::$passedTests = self::$passedTests.$test;
         }
         else
         {
-            self::$failedTests = self::$failedTests.'<div>'.$fileName.'</div>';
+            self::$failedTests = self::$failedTests.$test;
         }
     }
     
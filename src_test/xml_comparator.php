@@ -0,0 +1,248 @@
+<?php
+/**
+ * Project: IPP project, part 2
+ * @file xml_comparator.php
+ *
+ * @brief Comparison of XML files without JExamXML
+ * @author Patrik Sehnoutek, xsehno01
+ */
+
+
+/**
+ * Class for comparing XML files with options of JExamXML
+ */
+class XMLComparator
+{
+    // supported options and their values in tests/options
+    private static $options = [
+        "CaseSensitive" => 1,
+        "IgnoreWhitespaces" => 1,
+        "IgnoreAttributes" => 0,
+        "IgnoreValues" => 0
+    ];
+    // ignored elements, full names with parents separated by '>' or only names
+    private static $ignoredElements = [];
+
+    /**
+     * @brief Loads options from file in format of JExamXML
+     *
+     * @param fileName Name of options file, missing file keeps defaults
+     */
+    public static function loadOptions($fileName)
+    {
+        if (!is_readable($fileName))
+        {
+            return;
+        }
+
+        foreach (file($fileName, FILE_IGNORE_NEW_LINES) as $line)
+        {
+            $line = trim($line);
+            if ($line === "" || $line[0] == '#')
+            {
+                continue;
+            }
+
+            $option = explode('=', $line, 2);
+            if (count($option) != 2)
+            {
+                continue;
+            }
+            $name = trim($option[0]);
+            $value = trim($option[1]);
+
+            if ($name == "IgnoreElement")
+            {
+                array_push(self::$ignoredElements, $value);
+            }
+            else if (array_key_exists($name, self::$options))
+            {
+                self::$options[$name] = intval($value);
+            }
+        }
+    }
+
+    /**
+     * @brief Compares two XML files
+     *
+     * Order of attributes, empty-element shorthand, comments and XML
+     * declaration do not matter. Whitespace around text is ignored
+     * with option IgnoreWhitespaces.
+     *
+     * @param expectedFile Name of file with expected XML
+     * @param actualFile Name of file with generated XML
+     * @return true/false, null if a file is not valid XML
+     */
+    public static function compare($expectedFile, $actualFile)
+    {
+        $expected = self::loadDocument($expectedFile);
+        $actual = self::loadDocument($actualFile);
+
+        if ($expected === null || $actual === null)
+        {
+            return null;
+        }
+
+        return self::equalElements($expected->documentElement, $actual->documentElement, "");
+    }
+
+    /**
+     * @brief Loads XML document
+     *
+     * @param fileName Name of a file
+     * @return DOMDocument or null if file is not valid XML
+     */
+    private static function loadDocument($fileName)
+    {
+        $document = new DOMDocument();
+        $internalErrors = libxml_use_internal_errors(true);
+        $loaded = $document->load($fileName, LIBXML_NONET);
+        libxml_clear_errors();
+        libxml_use_internal_errors($internalErrors);
+
+        if (!$loaded || $document->documentElement === null)
+        {
+            return null;
+        }
+        return $document;
+    }
+
+    /**
+     * @brief Compares elements with their attributes and content
+     *
+     * @param path Names of parents separated by '>'
+     * @return true/false
+     */
+    private static function equalElements($expected, $actual, $path)
+    {
+        if (!self::equalStrings($expected->nodeName, $actual->nodeName))
+        {
+            return false;
+        }
+        $path = ($path === "") ? $expected->nodeName : $path.'>'.$expected->nodeName;
+
+        if (!self::$options["IgnoreAttributes"] && self::attributes($expected) !== self::attributes($actual))
+        {
+            return false;
+        }
+
+        $expectedChildren = self::children($expected, $path);
+        $actualChildren = self::children($actual, $path);
+        if (count($expectedChildren) != count($actualChildren))
+        {
+            return false;
+        }
+
+        foreach ($expectedChildren as $i => $expectedChild)
+        {
+            $actualChild = $actualChildren[$i];
+
+            if (is_string($expectedChild) && is_string($actualChild))
+            {
+                if (!self::$options["IgnoreValues"] && !self::equalStrings($expectedChild, $actualChild))
+                {
+                    return false;
+                }
+            }
+            else if (is_string($expectedChild) || is_string($actualChild)
+                     || !self::equalElements($expectedChild, $actualChild, $path))
+            {
+                return false;
+            }
+        }
+
+        return true;
+    }
+
+    /**
+     * @brief Gets attributes of element sorted by name
+     *
+     * @return Array of attribute values indexed by names
+     */
+    private static function attributes($element)
+    {
+        $attributes = [];
+        foreach ($element->attributes as $attribute)
+        {
+            $name = self::$options["CaseSensitive"] ? $attribute->nodeName : strtolower($attribute->nodeName);
+            $value = self::$options["CaseSensitive"] ? $attribute->nodeValue : strtolower($attribute->nodeValue);
+            $attributes[$name] = $value;
+        }
+        ksort($attributes);
+        return $attributes;
+    }
+
+    /**
+     * @brief Gets compared content of element
+     *
+     * Adjacent text and CDATA nodes are joined into one string,
+     * ignored elements, comments and processing instructions are skipped.
+     *
+     * @param path Full name of the element
+     * @return Array of child elements and strings
+     */
+    private static function children($element, $path)
+    {
+        $children = [];
+        $text = "";
+
+        foreach ($element->childNodes as $node)
+        {
+            if ($node->nodeType == XML_TEXT_NODE || $node->nodeType == XML_CDATA_SECTION_NODE)
+            {
+                $text = $text.$node->nodeValue;
+            }
+            else if ($node->nodeType == XML_ELEMENT_NODE && !self::isIgnored($node, $path))
+            {
+                self::addText($children, $text);
+                $text = "";
+                array_push($children, $node);
+            }
+        }
+        self::addText($children, $text);
+
+        return $children;
+    }
+
+    /**
+     * @brief Adds text to content unless it is empty
+     */
+    private static function addText(&$children, $text)
+    {
+        if (self::$options["IgnoreWhitespaces"])
+        {
+            $text = trim($text);
+        }
+        if ($text !== "")
+        {
+            array_push($children, $text);
+        }
+    }
+
+    /**
+     * @brief Checks if element is ignored by option IgnoreElement
+     *
+     * @param path Full name of the parent
+     * @return true/false
+     */
+    private static function isIgnored($element, $path)
+    {
+        return in_array($element->nodeName, self::$ignoredElements, true)
+            || in_array($path.'>'.$element->nodeName, self::$ignoredElements, true);
+    }
+
+    /**
+     * @brief Compares names or values with option CaseSensitive
+     *
+     * @return true/false
+     */
+    private static function equalStrings($expected, $actual)
+    {
+        if (self::$options["CaseSensitive"])
+        {
+            return $expected === $actual;
+        }
+        return strtolower($expected) === strtolower($actual);
+    }
+
+}
@@ -9,6 +9,7 @@
 
 
 include "src_test/html_generator.php";
+include "src_test/xml_comparator.php";
 
 $path = './';
 $recursive = false;
@@ -18,14 +19,18 @@ $parserOnly = false;
 $interpretOnly = false;
 $jexamdir = '/pub/courses/ipp/jexamxml/';
 $cleanTmp = true;
+$jobs = 1;
+$incremental = false;
+$intOptions = '';
+$textSource = false;
 
 $argc;
 $argv;
 $shortopts = 'hd:rp:i:j:n';
-$longopts =  ["help", "directory:", "recursive", "parse-script:", "int-script:", "parse-only", "int-only", "jexampath:", "noclean"];
+$longopts =  ["help", "directory:", "recursive", "parse-script:", "int-script:", "parse-only", "int-only", "jexampath:", "noclean", "jobs:", "incremental", "int-options:", "text-source"];
 $args = getopt($shortopts, $longopts);
 
-if (count($args) != (count($argv) - 1) || count($args) > 7)
+if (count($args) != (count($argv) - 1) || count($args) > 11)
 {
     fprintf(STDERR, "ERROR: Wrong argument/-s");
     exit(10);
@@ -50,8 +55,12 @@ if (array_key_exists('help', $args) || array_key_exists('h', $args))
     print("     -i, --int-script=file       interpret script, default ./interpret.py\n");
     print("     --parse-only                test only parser\n");
     print("     --int-only                  test only interpret\n");
+    print("     --int-options=options       additional options of interpret, e.g. --optimize\n");
+    print("     --text-source               interpret source code without parser (--source-format=text)\n");
     print("     -j, --jexampath=fir         path to directory containing jexaxml.jar\n");
     print("     -n, --noclean               do not remove temporary files\n");
+    print("     --jobs=N                    run at most N tests at once, default 1\n");
+    print("     --incremental               run only tests changed since the last run\n");
     exit(0);
 }
 
@@ -104,6 +113,29 @@ if (array_key_exists('int-only', $args))
     }
 }
 
+if (array_key_exists('int-options', $args))
+{
+    if (!is_string($args['int-options']) || $parserOnly)
+    {
+        fprintf(STDERR, "ERROR: Wrong argument/-s");
+        exit(10);
+    }
+    foreach (preg_split("/\s+/", $args['int-options'], -1, PREG_SPLIT_NO_EMPTY) as $option)
+    {
+        $intOptions = $intOptions.' '.escapeshellarg($option);
+    }
+}
+
+if (array_key_exists('text-source', $args))
+{
+    if ($parserOnly || $interpretOnly || array_key_exists('parse-script', $args) || array_key_exists('p', $args))
+    {
+        fprintf(STDERR, "ERROR: Wrong argument/-s");
+        exit(10);
+    }
+    $textSource = true;
+}
+
 if (array_key_exists('jexampath', $args) || array_key_exists('j', $args))
 {
     $jexamdir = isset($args['j']) ? $args['j'] : $args['jexampath'];
@@ -115,8 +147,28 @@ if (array_key_exists('noclean', $args))
     $cleanTmp = false;
 }
 
+if (array_key_exists('jobs', $args))
+{
+    if (!is_string($args['jobs']) || !preg_match("/^[1-9][0-9]*$/", $args['jobs']))
+    {
+        fprintf(STDERR, "ERROR: Wrong argument/-s");
+        exit(10);
+    }
+    $jobs = intval($args['jobs']);
+}
+
+if (array_key_exists('incremental', $args))
+{
+    $incremental = true;
+}
+
 $jexamexe = $jexamdir.'jexamxml.jar';
-check_file($jexamexe);
+// JExamXML is only a fallback of XMLComparator, required only if its path is given
+if (array_key_exists('jexampath', $args) || array_key_exists('j', $args))
+{
+    check_file($jexamexe);
+}
+XMLComparator::loadOptions($jexamdir.'options');
 
 // Iterator or Recursive Iterator
 $directoryIter = new RecursiveDirectoryIterator($path);
@@ -147,160 +199,390 @@ foreach($regexIter as $file)
 }
 array_multisort($tests);
 
-$allCount = 0;
-$successful = 0;
+// Results of previous runs
+$database = $path.'.test_results.json';
+$storedResults = $incremental ? load_results($database, test_mode()) : [];
+$scriptsHash = $incremental ? scripts_hash() : "";
+
+// Prepare tests in the order of the report
+$steps = [];
+$cachedResults = [];
+$testHashes = [];
+$index = 0;
+foreach($tests as $dirName => $dir)
+{
+    foreach($dir as $fileName)
+    {
+        $test = [
+            'src' => $dirName.$fileName.'.src',
+            'rc' => $dirName.$fileName.'.rc',
+            'in' => $dirName.$fileName.'.in',
+            'out' => $dirName.$fileName.'.out',
+            'myOut' => $dirName.$fileName.'.my_out',
+            'diff' => $dirName.$fileName.'.diffs.xml',
+            'myXML' => $dirName.$fileName.'.xml'
+        ];
+
+        if ($incremental)
+        {
+            $testHashes[$index] = test_hash($test, $scriptsHash);
+            if (array_key_exists($testHashes[$index], $storedResults))
+            {
+                $cachedResults[$index] = $storedResults[$testHashes[$index]];
+                $index++;
+                continue;
+            }
+        }
+
+        // Missing files
+        if (!file_exists($test['in']))
+        {
+            create_file($test['in'], "");
+        }
+        if (!file_exists($test['out']))
+        {
+            create_file($test['out'], "");
+        }
+        if (!file_exists($test['rc']))
+        {
+            create_file($test['rc'], "0");
+        }
+
+        $steps[$index++] = run_test($test);
+    }
+}
+
+// Execute tests
+$results = run_tests($steps, $jobs) + $cachedResults;
+ksort($results);
+
+if ($incremental)
+{
+    save_results($database, test_mode(), $testHashes, $results);
+}
+
+$allCount = count($results);
+$successful = count(array_filter($results));
 
 HTMLgenerator::generateHeader();
 HTMLgenerator::generateStartBody();
 
-// Execute tests
+$index = 0;
 foreach($tests as $dirName => $dir)
 {
     HTMLgenerator::addFolder($dirName);
 
     foreach($dir as $fileName)
     {
-		$allCount++;
-        $oldSuccessful = $successful;
-		
-		$srcFile = $dirName.$fileName.'.src';
-        $rcFile = $dirName.$fileName.'.rc';
-        $inFile = $dirName.$fileName.'.in';
-        $outFile = $dirName.$fileName.'.out';
-        $myOutFile = $dirName.$fileName.'.my_out';
-		$diffFile = './diffs.xml';
-		$myXMLFile = $dirName.$fileName.'.xml';
+        HTMLgenerator::addTest($fileName, $results[$index], array_key_exists($index, $cachedResults));
+        $index++;
+    }
 
-        // Missing files
-        if (!file_exists($inFile))
+    HTMLgenerator::generateFolder();
+}
+
+// Close body tag and generate print website source code to stdin
+HTMLgenerator::generateEndBody($successful, $allCount, count($cachedResults));
+HTMLgenerator::generateWebpage();
+
+/**
+ * @brief Steps of one test, yields shell commands and receives their exit codes
+ * 
+ * @param test Array with names of test files
+ * @return true if test passed
+ */
+function test_steps($test)
+{
+    global $parserOnly, $interpretOnly, $textSource, $parser, $interpret, $intOptions, $jexamexe, $jexamdir;
+
+    $rc = intval(file_get_contents($test['rc']));
+
+    // Parser only
+    if ($parserOnly)
+    {
+        check_file($parser);
+
+        $exitCode = yield 'php8.1 '.$parser.' < '.$test['src'].' > '.$test['myOut'].' 2> /dev/null';
+        if ($exitCode != $rc)
         {
-            create_file($inFile, "");
+            return false;
         }
-        if (!file_exists($outFile))
+        if ($exitCode != 0)
         {
-            create_file($outFile, "");
+            return true;
         }
-        if (!file_exists($rcFile))
+
+        // JExamXML is started only for files which are not valid XML
+        $equal = XMLComparator::compare($test['out'], $test['myOut']);
+        if ($equal !== null || !file_exists($jexamexe))
         {
-            create_file($rcFile, "0");
+            return $equal === true;
         }
 
-        // Parser only
-        if ($parserOnly)
-        {
-            check_file($parser);
+        $exitCode = yield 'java -jar '.$jexamexe.' '.$test['out'].' '.$test['myOut'].' '.$test['diff'].' '.' /D '.$jexamdir.'options';
+        return $exitCode == 0;
+    }
+    // Interpret only
+    else if ($interpretOnly)
+    {
+        check_file($interpret);
 
-            unset($output);
-            unset($exitCode);
-            exec('php8.1 '.$parser.' < '.$srcFile.' > '.$myOutFile.' 2> /dev/null', $output, $exitCode);
+        $exitCode = yield 'python3.8 '.$interpret.' --source='.$test['src'].' --input='.$test['in'].$intOptions.' > '.$test['myOut'].' 2> /dev/null';
+    }
+    // Both, source code is loaded by interpret
+    else if ($textSource)
+    {
+        check_file($interpret);
 
-			$file = fopen($rcFile, 'r');
-			$rc = fgets($file);
-			fclose($file);
+        $exitCode = yield 'python3.8 '.$interpret.' --source='.$test['src'].' --source-format=text --input='.$test['in'].$intOptions.' > '.$test['myOut'].' 2> /dev/null';
+    }
+    // Both
+    else
+    {
+        check_file($parser);
+        check_file($interpret);
 
-			if ($exitCode == intval( $rc ))
-            {
-                if ($exitCode == 0)
-                {
-                    unset($output);
-                    unset($exitCode);
-                    exec('java -jar '.$jexamexe.' '.$outFile.' '.$myOutFile.' '.$diffFile.' '.' /D '.$jexamdir.'options', $output, $exitCode);
-                    
-                    if ($exitCode == 0) $successful++;
-                }
-                else
-                {
-                    $successful++;
-                }
-            }
+        $exitCode = yield 'php8.1 '.$parser.' < '.$test['src'].' > '.$test['myXML'].' 2> /dev/null';
+        if ($exitCode != 0)
+        {
+            return $exitCode == $rc;
         }
-        // Interpret only
-        else if ($interpretOnly)
+
+        $exitCode = yield 'python3.8 '.$interpret.' --source='.$test['myXML'].' --input='.$test['in'].$intOptions.' > '.$test['myOut'].' 2> /dev/null';
+    }
+
+    if ($exitCode != $rc)
+    {
+        return false;
+    }
+    if ($exitCode != 0)
+    {
+        return true;
+    }
+
+    $exitCode = yield 'diff '.$test['out'].' '.$test['myOut'].' 2> /dev/null';
+    return $exitCode == 0;
+}
+
+/**
+ * @brief Executes steps of one test and removes its temporary files
+ * 
+ * @param test Array with names of test files
+ * @return true if test passed
+ */
+function run_test($test)
+{
+    global $cleanTmp;
+
+    $passed = yield from test_steps($test);
+
+    // Remove tmp files
+    if ($cleanTmp)
+    {
+        foreach ([$test['diff'], $test['myOut'], $test['myXML']] as $tmpFile)
         {
-            check_file($interpret);
+            if (file_exists($tmpFile)) unlink($tmpFile);
+        }
+    }
 
-            unset($output);
-            unset($exitCode);
-            exec('python3.8 '.$interpret.' --source='.$srcFile.' --input='.$inFile.' > '.$myOutFile.' 2> /dev/null', $output, $exitCode);
-            
-            $file = fopen($rcFile, 'r');
-			$rc = fgets($file);
-			fclose($file);
+    return $passed;
+}
 
-			if ($exitCode == intval( $rc ))
+/**
+ * @brief Runs tests with at most $jobs commands executed at once
+ * 
+ * @param steps Array of generators returned by run_test() indexed by tests
+ * @param jobs Maximum number of concurrent commands
+ * @return Array of results with indexes of steps
+ */
+function run_tests($steps, $jobs)
+{
+    // output of commands is not part of the report
+    $descriptors = [0 => ['file', '/dev/null', 'r'], 1 => ['file', '/dev/null', 'w'], 2 => ['file', '/dev/null', 'w']];
+    $results = [];
+    // index of test => process of its current command
+    $running = [];
+    $indexes = array_keys($steps);
+    $next = 0;
+
+    while ($next < count($indexes) || !empty($running))
+    {
+        // start next tests
+        while (count($running) < $jobs && $next < count($indexes))
+        {
+            $index = $indexes[$next++];
+            if ($steps[$index]->valid())
             {
-                if ($exitCode == 0)
-                {
-                    unset($output);
-                    unset($exitCode);
-                    exec('diff '.$outFile.' '.$myOutFile.' 2> /dev/null', $output, $exitCode);
-                    
-                    if ($exitCode == 0) $successful++;
-                }
-                else
-                {
-                    $successful++;
-                }
+                $running[$index] = proc_open($steps[$index]->current(), $descriptors, $pipes);
+            }
+            else
+            {
+                $results[$index] = $steps[$index]->getReturn();
             }
-
         }
-        // Both
-        else{
-            check_file($parser);
-            check_file($interpret);
-
-            unset($output);
-            unset($exitCode);
-            exec('php8.1 '.$parser.' < '.$srcFile.' > '.$myXMLFile.' 2> /dev/null', $output, $exitCode);
 
-			$file = fopen($rcFile, 'r');
-			$rc = fgets($file);
-			fclose($file);
+        // continue tests with finished commands
+        $finished = false;
+        foreach ($running as $index => $process)
+        {
+            $status = proc_get_status($process);
+            if ($status['running'])
+            {
+                continue;
+            }
+            proc_close($process);
+            $finished = true;
 
-            if ($exitCode == 0)
+            $steps[$index]->send($status['exitcode']);
+            if ($steps[$index]->valid())
             {
-                unset($output);
-                unset($exitCode);
-                exec('python3.8 '.$interpret.' --source='.$myXMLFile.' --input='.$inFile.' > '.$myOutFile.' 2> /dev/null', $output, $exitCode);
-                
-                if ($exitCode == intval( $rc ))
-                {
-                    if ($exitCode == 0)
-                    {
-                        unset($output);
-                        unset($exitCode);
-                        exec('diff '.$outFile.' '.$myOutFile.' 2> /dev/null', $output, $exitCode);
-                        
-                        if ($exitCode == 0) $successful++;
-                    }
-                    else
-                    {
-                        $successful++;
-                    }
-                }
+                $running[$index] = proc_open($steps[$index]->current(), $descriptors, $pipes);
             }
-            else if ($exitCode == intval( $rc ))
+            else
             {
-                $successful++;
+                unset($running[$index]);
+                $results[$index] = $steps[$index]->getReturn();
             }
         }
 
-        // Remove tmp files
-        if ($cleanTmp)
+        if (!$finished && !empty($running))
         {
-            exec('rm -f '.$diffFile.' '.$myOutFile.' '.$myXMLFile);
+            usleep(1000);
         }
+    }
+
+    ksort($results);
+    return $results;
+}
 
-        HTMLgenerator::addTest($fileName, boolval($successful-$oldSuccessful));
+/**
+ * @brief Loads results database, every test mode has its own part
+ * 
+ * @param fileName Name of results database
+ * @return Array of results of tests indexed by test modes
+ */
+function load_database($fileName)
+{
+    if (!file_exists($fileName))
+    {
+        return [];
     }
+    $database = json_decode(file_get_contents($fileName), true);
+    return is_array($database) ? array_filter($database, 'is_array') : [];
+}
 
-    HTMLgenerator::generateFolder();
- 
+/**
+ * @brief Loads results of previous runs in the same test mode
+ * 
+ * @param fileName Name of results database
+ * @param mode Test mode returned by test_mode()
+ * @return Array of results indexed by hashes of tests
+ */
+function load_results($fileName, $mode)
+{
+    $database = load_database($fileName);
+    return array_key_exists($mode, $database) ? $database[$mode] : [];
 }
 
-// Close body tag and generate print website source code to stdin
-HTMLgenerator::generateEndBody($successful, $allCount);
-HTMLgenerator::generateWebpage();
+/**
+ * @brief Saves results of this run, results of removed or changed tests are dropped
+ * 
+ * Results of other test modes are kept.
+ * 
+ * @param fileName Name of results database
+ * @param mode Test mode returned by test_mode()
+ * @param hashes Array of hashes of tests
+ * @param results Array of results with the same indexes
+ */
+function save_results($fileName, $mode, $hashes, $results)
+{
+    $database = load_database($fileName);
+    $database[$mode] = [];
+    foreach ($hashes as $index => $hash)
+    {
+        $database[$mode][$hash] = $results[$index];
+    }
+    create_file($fileName, json_encode($database));
+}
+
+/**
+ * @brief Test mode with options of interpret
+ * 
+ * @return String, e.g. "int-only '--optimize'"
+ */
+function test_mode()
+{
+    global $parserOnly, $interpretOnly, $textSource, $intOptions;
+
+    return ($parserOnly ? 'parse-only' : ($interpretOnly ? 'int-only' : ($textSource ? 'text-source' : 'both'))).$intOptions;
+}
+
+/**
+ * @brief Hash of tested scripts with their included sources and of test mode
+ * 
+ * @return sha1 hash
+ */
+function scripts_hash()
+{
+    global $parserOnly, $interpretOnly, $textSource, $parser, $interpret, $jexamdir;
+
+    $files = [];
+    if (!$interpretOnly && !$textSource)
+    {
+        $files = array_merge($files, [$parser, $jexamdir.'options', __DIR__.'/src_test/xml_comparator.php'], source_files(dirname($parser).'/src_parse'));
+    }
+    if (!$parserOnly)
+    {
+        $files = array_merge($files, [$interpret], source_files(dirname($interpret).'/src_interpret'));
+    }
+
+    $hashes = [test_mode()];
+    foreach ($files as $file)
+    {
+        array_push($hashes, $file.'='.(file_exists($file) ? sha1_file($file) : ''));
+    }
+    return sha1(implode("\n", $hashes));
+}
+
+/**
+ * @brief Finds PHP and Python sources in directory
+ * 
+ * @param dirName Name of a directory
+ * @return Sorted array of file names
+ */
+function source_files($dirName)
+{
+    if (!is_dir($dirName))
+    {
+        return [];
+    }
+
+    $files = [];
+    $iterator = new RecursiveIteratorIterator(new RecursiveDirectoryIterator($dirName, FilesystemIterator::SKIP_DOTS));
+    foreach (new RegexIterator($iterator, "/\.(php|py)$/") as $file)
+    {
+        array_push($files, $file->getPathname());
+    }
+    sort($files);
+    return $files;
+}
+
+/**
+ * @brief Hash of test files and tested scripts, missing files have default content
+ * 
+ * @param test Array with names of test files
+ * @param scriptsHash Hash returned by scripts_hash()
+ * @return sha1 hash
+ */
+function test_hash($test, $scriptsHash)
+{
+    $hashes = [$scriptsHash, $test['src']];
+    foreach (['src' => "", 'in' => "", 'out' => "", 'rc' => "0"] as $type => $content)
+    {
+        array_push($hashes, file_exists($test[$type]) ? sha1_file($test[$type]) : sha1($content));
+    }
+    return sha1(implode("\n", $hashes));
+}
 
 // Create files with content
 function create_file($fileName, $content)
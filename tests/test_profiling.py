@@ -0,0 +1,93 @@
+##
+#   @file test_profiling.py
+#
+#   @brief Tests of reports written by --sample and --profile
+#   @author Patrik Sehnoutek, xsehno01
+#
+#   Run by: python3 -m unittest discover tests
+#
+
+import os, re, subprocess, sys, tempfile, unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INTERPRET = os.path.join(ROOT, "interpret.py")
+TESTS = os.path.join(ROOT, "tests", "int-only")
+
+
+def run(test, *options):
+    """Run interpret on int-only test with given options.
+
+        :return: completed process with captured stdout and stderr
+    """
+    source = os.path.join(TESTS, test + ".src")
+    return subprocess.run([sys.executable, INTERPRET, "--source=" + source, "--input=" + os.devnull] + list(options),
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def expected_output(test):
+    with open(os.path.join(TESTS, test + ".out")) as f:
+        return f.read()
+
+
+class SamplerTest(unittest.TestCase):
+    """Collapsed call stacks written by --sample."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, "stacks.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_recursive_call(self):
+        result = run("recursive_call", "--sample=" + self.output)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, expected_output("recursive_call"))
+
+        with open(self.output) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r"^main(;fib)* [1-9][0-9]*$")
+        # the program spends nearly all time in recursive calls
+        self.assertTrue(any(line.startswith("main;fib;fib") for line in lines))
+
+    def test_load_error(self):
+        result = run("label_int_operand", "--sample=" + self.output)
+        self.assertEqual(result.returncode, 32)
+        self.assertFalse(os.path.exists(self.output))
+
+
+class ProfilerTest(unittest.TestCase):
+    """Report written by --profile."""
+
+    def test_output_unchanged(self):
+        for test in ["recursive_call", "compile_block_error", "stack_clears"]:
+            with self.subTest(test=test):
+                plain = run(test)
+                profiled = run(test, "--profile")
+                self.assertEqual(profiled.returncode, plain.returncode)
+                self.assertEqual(profiled.stdout, plain.stdout)
+                self.assertTrue(profiled.stderr.startswith("Profile: "))
+
+    def test_counts(self):
+        result = run("recursive_call", "--profile")
+        self.assertEqual(result.stdout, expected_output("recursive_call"))
+        # fib(18) is called 8361 times, each call ends by RETURN
+        for opcode, count in [("CALL", 8361), ("RETURN", 8361), ("ADDS", 4180), ("WRITE", 2)]:
+            self.assertRegex(result.stderr, r"(?m)^%s +%d +[0-9.]+$" % (opcode, count))
+        self.assertRegex(result.stderr, r"(?m)^Label \(CALL\) +Calls +Time \[s\]\nfib +8361 +[0-9.]+$")
+
+    def test_profile_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "profile.txt")
+            result = run("recursive_call", "--profile", "--profile-file=" + output)
+            self.assertEqual(result.returncode, 0)
+            self.assertEqual(result.stdout, expected_output("recursive_call"))
+            self.assertEqual(result.stderr, "")
+            with open(output) as f:
+                self.assertRegex(f.read(), r"(?m)^fib +8361 ")
+
+
+if __name__ == "__main__":
+    unittest.main()